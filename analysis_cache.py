@@ -0,0 +1,147 @@
+# /stock_bot/analysis_cache.py
+
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from datetime import time as dt_time
+import numpy as np
+import pandas as pd
+import telemetry
+
+
+def chart_cache_key(df, indicator_settings, title, prompt, model, image_settings=None):
+    """
+    Builds a content hash for a chart analysis request.
+
+    The key covers everything that determines what the VLM sees and is asked: the OHLCV
+    bars and their timestamps, the indicator settings, the chart title, the prompt, the
+    model name and the image encoding (render DPI, resizing, palette, detail level).
+    Identical inputs always map to the same key.
+    """
+    digest = hashlib.sha256()
+    digest.update(df.index.values.astype('datetime64[ns]').astype('int64').tobytes())
+    digest.update(np.ascontiguousarray(df[['Open', 'High', 'Low', 'Close', 'Volume']].to_numpy(dtype='float64')).tobytes())
+    digest.update(json.dumps(indicator_settings, sort_keys=True).encode('utf-8'))
+    if image_settings is not None:
+        digest.update(json.dumps(image_settings, sort_keys=True).encode('utf-8'))
+    for text in (title, prompt, model):
+        digest.update(b'\0' + text.encode('utf-8'))
+    return digest.hexdigest()
+
+
+def completed_sessions(df, timezone, session_close, now=None):
+    """
+    Drops today's daily bar while its session is still open. Keying a daily chart on the
+    completed sessions keeps its key, and so its cached analysis, stable through the trading
+    day instead of changing with every refresh of the forming bar.
+
+    Args:
+        timezone (str): Exchange timezone the daily bars are dated in.
+        session_close (str): Session close time, "HH:MM" in exchange time.
+        now: Current time; defaults to the clock.
+    """
+    if df is None or df.empty:
+        return df
+    now = pd.Timestamp.now(tz=timezone) if now is None else pd.Timestamp(now).tz_convert(timezone)
+    if df.index[-1].normalize() == now.tz_localize(None).normalize() and now.time() < dt_time.fromisoformat(session_close):
+        return df.iloc[:-1]
+    return df
+
+
+class AnalysisCache:
+    """
+    Persistent cache of VLM analyses keyed by chart_cache_key.
+
+    Each entry is one JSON file. Entries older than `ttl_seconds` are treated as misses and
+    removed, and the oldest entries are evicted once more than `max_entries` are stored.
+    Entry files are read and written without holding the lock (writes are atomic renames);
+    the lock only guards the counters and the in-memory entry count that triggers eviction.
+    """
+    def __init__(self, directory, ttl_seconds, max_entries):
+        self.directory = directory
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        os.makedirs(self.directory, exist_ok=True)
+        self._entries = len(self._scan())
+
+    def _path(self, key):
+        return os.path.join(self.directory, f"{key}.json")
+
+    def get(self, key):
+        """Returns the cached analysis for `key`, or None on a miss or expired entry."""
+        path = self._path(key)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                entry = json.load(f)
+            stored_at, analysis = float(entry['stored_at']), entry['analysis']
+        except (OSError, json.JSONDecodeError, KeyError, TypeError, ValueError):
+            # Unreadable or malformed entries are misses; the next put overwrites them.
+            self._count_miss()
+            return None
+
+        if time.time() - stored_at > self.ttl_seconds:
+            if self._remove(path):
+                with self._lock:
+                    self._entries -= 1
+            self._count_miss()
+            return None
+        with self._lock:
+            self.hits += 1
+        telemetry.increment("analysis_cache_hits")
+        return analysis
+
+    def _count_miss(self):
+        with self._lock:
+            self.misses += 1
+        telemetry.increment("analysis_cache_misses")
+
+    def put(self, key, analysis):
+        """Stores an analysis and evicts the oldest entries beyond `max_entries`."""
+        path = self._path(key)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({"stored_at": time.time(), "analysis": analysis}, f)
+        is_new = not os.path.exists(path)
+        os.replace(tmp_path, path)
+        with self._lock:
+            self._entries += is_new
+            if self._entries > self.max_entries:
+                self._evict()
+
+    def _scan(self):
+        return [e for e in os.scandir(self.directory) if e.name.endswith('.json')]
+
+    def _remove(self, path):
+        try:
+            os.remove(path)
+            return True
+        except OSError:
+            return False
+
+    def _evict(self):
+        """Removes the oldest entries beyond max_entries. Runs under the lock, only once the count is exceeded."""
+        entries = self._scan()
+        excess = len(entries) - self.max_entries
+        if excess > 0:
+            entries.sort(key=lambda e: e.stat().st_mtime)
+            for entry in entries[:excess]:
+                self._remove(entry.path)
+            logging.info("Analysis cache evicted %s oldest entries.", excess)
+        # Re-sync with the directory, which also corrects concurrent puts of the same new key.
+        self._entries = max(len(entries) - max(excess, 0), 0)
+
+    def stats(self):
+        """Returns hit/miss counters for monitoring."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+            }
@@ -0,0 +1,22 @@
+# /stock_bot/analysis_recorder.py
+
+import json
+import threading
+import pandas as pd
+
+_record_lock = threading.Lock()
+
+
+def record_analysis(path, symbol, timeframe, timestamp, analysis):
+    """Appends one VLM analysis to a JSONL file so it can be replayed by the backtester."""
+    line = json.dumps({"symbol": symbol, "timeframe": timeframe,
+                       "timestamp": pd.Timestamp(timestamp).isoformat(), "analysis": analysis})
+    with _record_lock:
+        with open(path, 'a', encoding='utf-8') as f:
+            f.write(line + "\n")
+
+
+def load_records(path):
+    """Reads back the analyses appended by record_analysis, in recording order."""
+    with open(path, 'r', encoding='utf-8') as f:
+        return [json.loads(line) for line in f if line.strip()]
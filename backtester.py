@@ -0,0 +1,381 @@
+# /stock_bot/backtester.py
+
+import itertools
+import logging
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+from config import INDICATOR_SETTINGS_DAILY, INDICATOR_SETTINGS_HOURLY, RISK_SETTINGS, BACKTEST_SETTINGS, SYMBOL_SECTORS
+from chart_generator import resample_bars
+from indicator_engine import compute_indicators_ragged
+from risk_manager import size_positions, apply_portfolio_caps
+from analysis_recorder import load_records
+
+
+def load_history(store, symbols):
+    """
+    Reads the full stored history for backtesting from a BarStore.
+
+    Returns:
+        dict: {symbol: {"1D": daily bars, "4H": 4H bars resampled from 1h}}, like fetch_universe_data.
+    """
+    history = {}
+    for symbol in symbols:
+        daily, hourly = store.read(symbol, '1d'), store.read(symbol, '1h')
+        if daily is None or hourly is None:
+            logging.warning("No stored history for %s; leaving it out of the backtest.", symbol)
+            continue
+        history[symbol] = {"1D": daily, "4H": resample_bars(hourly)}
+    return history
+
+
+# --- Analyzers: VLM-style sentiment and S/R levels for every bar of every symbol ---
+#
+# analyze_universe(timeframe, frames) takes {symbol: bars} and returns, per symbol, a dict of
+# 'sentiment' (one string per bar) and 'support' / 'resistance' (bars x levels, NaN-padded).
+
+class RuleBasedAnalyzer:
+    """
+    Deterministic stand-in for the VLM.
+
+    A bar is 'bullish' when close > MA, MACD histogram > 0 and RSI is below the overbought
+    level, 'bearish' for the mirror case, and 'neutral' otherwise. Support and resistance
+    are the lowest low and highest high of the previous `sr_lookback` bars.
+    """
+    def __init__(self, sr_lookback=20, trend_ma=20, rsi_overbought=70, rsi_oversold=30):
+        self.sr_lookback = sr_lookback
+        self.trend_ma = trend_ma
+        self.rsi_overbought = rsi_overbought
+        self.rsi_oversold = rsi_oversold
+
+    def analyze_universe(self, timeframe, frames):
+        settings = INDICATOR_SETTINGS_DAILY if timeframe == "1D" else INDICATOR_SETTINGS_HOURLY
+        settings = {**settings, "moving_averages": sorted(set(settings['moving_averages']) | {self.trend_ma})}
+        closes = [df['Close'].to_numpy(dtype='float64') for df in frames.values()]
+        results = {}
+        for (symbol, df), close, indicators in zip(frames.items(), closes,
+                                                   compute_indicators_ragged(closes, settings)):
+            ma, hist, rsi = indicators[f'MA_{self.trend_ma}'], indicators['MACD_Hist'], indicators['RSI']
+            bullish = (close > ma) & (hist > 0) & (rsi < self.rsi_overbought)
+            bearish = (close < ma) & (hist < 0) & (rsi > self.rsi_oversold)
+            results[symbol] = {
+                "sentiment": np.where(bullish, "bullish", np.where(bearish, "bearish", "neutral")),
+                "support": df['Low'].rolling(self.sr_lookback).min().shift(1).to_numpy()[:, np.newaxis],
+                "resistance": df['High'].rolling(self.sr_lookback).max().shift(1).to_numpy()[:, np.newaxis],
+            }
+        return results
+
+
+class RecordedAnalyzer:
+    """
+    Replays VLM analyses captured with analysis_recorder.record_analysis(). Each bar gets the latest analysis
+    recorded at or before its timestamp; bars before the first record are 'neutral'.
+    """
+    def __init__(self, records):
+        self.records = records
+
+    @classmethod
+    def load(cls, path):
+        return cls(load_records(path))
+
+    @staticmethod
+    def _levels(analysis, side):
+        try:
+            return [float(level['level']) for level in analysis['support_resistance'][side]]
+        except (KeyError, TypeError, ValueError):
+            return []
+
+    def _replay(self, records, bar_times):
+        records = sorted(records, key=lambda r: r['recorded_at'])
+        recorded_at = np.array([r['recorded_at'] for r in records], dtype='datetime64[ns]')
+        # Position 0 stands for 'nothing recorded yet', for bars before the first record.
+        position = np.searchsorted(recorded_at, bar_times, side='right')
+        analyses = [{}] + [r['analysis'] for r in records]
+        sentiments = np.array([str(a.get('technical_sentiment', {}).get('sentiment', 'neutral')).lower()
+                               for a in analyses])
+        replayed = {"sentiment": sentiments[position]}
+        for side in ("support", "resistance"):
+            levels = [self._levels(a, side) for a in analyses]
+            padded = np.full((len(levels), max(1, max(len(l) for l in levels))), np.nan)
+            for row, values in enumerate(levels):
+                padded[row, :len(values)] = values
+            replayed[side] = padded[position]
+        return replayed
+
+    def analyze_universe(self, timeframe, frames):
+        by_symbol = {}
+        for record in self.records:
+            if record['timeframe'] == timeframe:
+                recorded_at = pd.Timestamp(record['timestamp']).tz_localize(None).to_datetime64()
+                by_symbol.setdefault(record['symbol'], []).append({**record, "recorded_at": recorded_at})
+        return {symbol: self._replay(by_symbol.get(symbol, []), df.index.values.astype('datetime64[ns]'))
+                for symbol, df in frames.items()}
+
+
+# --- Vectorized decision, sizing and fill simulation ---
+
+def combine_signals(daily_sentiment, hourly_sentiment):
+    """Vectorized form of CentralOrchestrationModule._get_final_signal over arrays of sentiments."""
+    def matches(sentiments, keyword):
+        # Sentiments repeat a lot, so test each distinct string once.
+        unique, inverse = np.unique(np.asarray(sentiments, dtype=str), return_inverse=True)
+        return np.array([keyword in text.lower() for text in unique], dtype=bool)[inverse]
+    buy = matches(daily_sentiment, 'bullish') & matches(hourly_sentiment, 'bullish')
+    sell = matches(daily_sentiment, 'bearish') & matches(hourly_sentiment, 'bearish')
+    return np.where(buy, "BUY", np.where(sell, "SELL", "HOLD"))
+
+def simulate_fills(entry_idx, is_buy, stop, target, open_, high, low, close, max_holding_bars):
+    """
+    Finds the exit of every trade at once on an (n_trades x max_holding_bars) grid of future bars.
+
+    A bar touching the stop exits at the stop (or the open if it gapped through); touching the
+    target exits at the target. If both are touched in the same bar the stop is assumed to have
+    hit first. Trades that hit neither exit at the close after `max_holding_bars` or at the end
+    of the data.
+
+    Returns:
+        tuple: (exit_idx, exit_price, reason) arrays.
+    """
+    n = len(close)
+    offsets = np.arange(1, max_holding_bars + 1)
+    idx = entry_idx[:, None] + offsets[None, :]
+    in_range = idx < n
+    idx = np.minimum(idx, n - 1)
+    buy = is_buy[:, None]
+    hit_stop = in_range & np.where(buy, low[idx] <= stop[:, None], high[idx] >= stop[:, None])
+    hit_target = in_range & np.where(buy, high[idx] >= target[:, None], low[idx] <= target[:, None])
+
+    never = max_holding_bars
+    first_stop = np.where(hit_stop.any(axis=1), hit_stop.argmax(axis=1), never)
+    first_target = np.where(hit_target.any(axis=1), hit_target.argmax(axis=1), never)
+    stopped = (first_stop <= first_target) & (first_stop < never)
+    targeted = (first_target < first_stop)
+
+    last_idx = np.minimum(entry_idx + max_holding_bars, n - 1)
+    exit_idx = np.where(stopped, entry_idx + 1 + first_stop,
+                        np.where(targeted, entry_idx + 1 + first_target, last_idx))
+    gap_open = open_[np.minimum(exit_idx, n - 1)]
+    stop_fill = np.where(is_buy, np.minimum(stop, gap_open), np.maximum(stop, gap_open))
+    exit_price = np.where(stopped, stop_fill, np.where(targeted, target, close[exit_idx]))
+    reason = np.where(stopped, "STOP", np.where(targeted, "TARGET",
+                      np.where(entry_idx + max_holding_bars <= n - 1, "TIMEOUT", "END_OF_DATA")))
+    return exit_idx, exit_price, reason
+
+
+class Backtester:
+    """
+    Replays stored bars through the analyzer, decision and risk logic and simulates fills.
+
+    At every 4H bar the daily analysis comes from the last fully closed daily bar, the signal
+    follows _get_final_signal, and entries are sized like RiskManager at the 4H close. Only one
+    position per symbol is open at a time. The signals of all symbols at the same 4H bar form
+    one run: like place_trades, they pass through the portfolio caps together, in symbol order,
+    after the positions still open at that bar, unless risk_settings['portfolio_caps'] is off.
+    """
+    def __init__(self, analyzer, risk_settings=None, max_holding_bars=None):
+        self.analyzer = analyzer
+        self.risk_settings = {**RISK_SETTINGS, **(risk_settings or {})}
+        self.max_holding_bars = max_holding_bars or BACKTEST_SETTINGS['max_holding_bars']
+
+    def _symbol_trades(self, symbol, bars, daily, hourly):
+        df_4h, df_1d = bars["4H"], bars["1D"]
+        # A daily bar is only known once its session has closed, i.e. from the next day on.
+        daily_known_at = (df_1d.index + pd.Timedelta(days=1)).values.astype('datetime64[ns]')
+        daily_position = np.searchsorted(daily_known_at, df_4h.index.values.astype('datetime64[ns]'), side='right') - 1
+        daily_sentiment = np.where(daily_position >= 0, daily["sentiment"][np.maximum(daily_position, 0)], "neutral")
+
+        signals = combine_signals(daily_sentiment, hourly["sentiment"])
+        entry_idx = np.flatnonzero(signals != "HOLD")
+        if len(entry_idx) == 0:
+            return None
+        close = df_4h['Close'].to_numpy(dtype='float64')
+        is_buy = signals[entry_idx] == "BUY"
+        entry = close[entry_idx]
+        stop, target, shares, valid = size_positions(
+            is_buy, entry,
+            np.sort(hourly["support"][entry_idx], axis=1), np.sort(hourly["resistance"][entry_idx], axis=1),
+            self.risk_settings)
+        entry_idx, is_buy, entry, stop, target, shares = (
+            a[valid] for a in (entry_idx, is_buy, entry, stop, target, shares))
+        if len(entry_idx) == 0:
+            return None
+
+        exit_idx, exit_price, reason = simulate_fills(
+            entry_idx, is_buy, stop, target, df_4h['Open'].to_numpy(dtype='float64'),
+            df_4h['High'].to_numpy(dtype='float64'), df_4h['Low'].to_numpy(dtype='float64'),
+            close, self.max_holding_bars)
+
+        direction = np.where(is_buy, 1.0, -1.0)
+        return pd.DataFrame({
+            "symbol": symbol,
+            "signal": np.where(is_buy, "BUY", "SELL"),
+            "entry_time": df_4h.index[entry_idx],
+            "exit_time": df_4h.index[exit_idx],
+            "entry_price": entry, "stop_loss": stop, "take_profit": target,
+            "exit_price": exit_price, "position_size_shares": shares,
+            "pnl": direction * (exit_price - entry) * shares,
+            "exit_reason": reason,
+        })
+
+    def _admit(self, candidates):
+        """
+        Picks the trades actually taken from every symbol's sized signals, in entry-time order.
+
+        A signal is skipped while its symbol still has an open trade. The remaining signals of
+        each 4H bar are capped together with apply_portfolio_caps when portfolio caps are on,
+        with the trades still open at that bar counted first; a trade that only partly fits is
+        taken with its size and P&L scaled down.
+        """
+        entry_times = candidates["entry_time"].to_numpy()
+        exit_times = candidates["exit_time"].to_numpy()
+        symbols = candidates["symbol"].to_numpy()
+        exposure = (candidates["position_size_shares"] * candidates["entry_price"]).to_numpy(dtype='float64')
+        risk_amount = self.risk_settings['account_equity'] * (self.risk_settings['risk_per_trade_percent'] / 100)
+        caps = self.risk_settings['portfolio_caps']
+        scale = np.zeros(len(candidates))
+        # symbol -> (exit time, risk, exposure) of its open trade
+        open_trades = {}
+        bar_starts = np.flatnonzero(np.r_[True, entry_times[1:] != entry_times[:-1]])
+        for start, stop in zip(bar_starts, np.r_[bar_starts[1:], len(candidates)]):
+            rows = [row for row in range(start, stop)
+                    if symbols[row] not in open_trades or entry_times[row] > open_trades[symbols[row]][0]]
+            fractions = np.ones(len(rows))
+            if caps and rows:
+                held = [(risk, held_exposure, SYMBOL_SECTORS.get(symbol, "Unknown"))
+                        for symbol, (until, risk, held_exposure) in open_trades.items() if until >= entry_times[start]]
+                sectors = [SYMBOL_SECTORS.get(symbols[row], "Unknown") for row in rows]
+                fractions, _ = apply_portfolio_caps(np.full(len(rows), risk_amount), exposure[rows],
+                                                    sectors, self.risk_settings, open_positions=held)
+            for row, fraction in zip(rows, fractions):
+                if fraction > 0:
+                    scale[row] = fraction
+                    open_trades[symbols[row]] = (exit_times[row], risk_amount * fraction, exposure[row] * fraction)
+        taken = candidates[scale > 0].copy()
+        taken["position_size_shares"] *= scale[scale > 0]
+        taken["pnl"] *= scale[scale > 0]
+        return taken
+
+    def run(self, market_data):
+        """
+        Backtests every symbol in `market_data` ({symbol: {"1D": df, "4H": df}}).
+
+        Returns:
+            dict: 'trades' (DataFrame), 'equity' (portfolio equity at each exit) and 'summary'.
+                The run stops if equity reaches zero; summary['ruined'] is then True.
+        """
+        start = time.perf_counter()
+        market_data = {symbol: bars for symbol, bars in market_data.items()
+                       if len(bars["4H"]) >= 2 and not bars["1D"].empty}
+        daily = self.analyzer.analyze_universe("1D", {s: bars["1D"] for s, bars in market_data.items()})
+        hourly = self.analyzer.analyze_universe("4H", {s: bars["4H"] for s, bars in market_data.items()})
+        frames = [self._symbol_trades(symbol, bars, daily[symbol], hourly[symbol])
+                  for symbol, bars in market_data.items()]
+        frames = [f for f in frames if f is not None and not f.empty]
+        if frames:
+            # A stable sort keeps the symbols of each 4H bar in market_data order, their cap priority.
+            candidates = pd.concat(frames, ignore_index=True).sort_values("entry_time", kind="stable",
+                                                                          ignore_index=True)
+            trades = self._admit(candidates).sort_values("exit_time", kind="stable", ignore_index=True)
+        else:
+            trades = pd.DataFrame(columns=["symbol", "exit_time", "pnl"])
+
+        starting_equity = self.risk_settings['account_equity']
+        trades, ruined = self._stop_at_ruin(trades, starting_equity)
+        equity = pd.Series(starting_equity + trades["pnl"].astype(float).cumsum().to_numpy(),
+                           index=pd.DatetimeIndex(trades["exit_time"]), name="equity")
+        summary = self._summarize(trades, equity, starting_equity)
+        summary["ruined"] = ruined
+        summary["seconds"] = round(time.perf_counter() - start, 3)
+        return {"trades": trades, "equity": equity, "summary": summary}
+
+    @staticmethod
+    def _stop_at_ruin(trades, starting_equity):
+        """
+        Ends the backtest at the first exit that takes equity to zero or below: that trade's
+        loss is limited to the remaining equity and every later exit is dropped.
+
+        Returns:
+            tuple: (trades, ruined)
+        """
+        if trades.empty:
+            return trades, False
+        pnl = trades["pnl"].astype(float).to_numpy()
+        equity = starting_equity + np.cumsum(pnl)
+        ruin = np.flatnonzero(equity <= 0)
+        if len(ruin) == 0:
+            return trades, False
+        last = ruin[0]
+        trades = trades.iloc[:last + 1].copy()
+        trades.loc[trades.index[last], "pnl"] = -(equity[last] - pnl[last])
+        logging.warning("Backtest equity reached zero at %s; %s later trades were not taken.",
+                        trades['exit_time'].iloc[last], len(pnl) - last - 1)
+        return trades, True
+
+    @staticmethod
+    def _summarize(trades, equity, starting_equity):
+        pnl = trades["pnl"].astype(float)
+        curve = np.concatenate([[starting_equity], equity.to_numpy()])
+        peaks = np.maximum.accumulate(curve)
+        gross_loss = -pnl[pnl < 0].sum()
+        return {
+            "symbols": int(trades["symbol"].nunique()),
+            "trades": int(len(trades)),
+            "win_rate": round(float((pnl > 0).mean()), 3) if len(pnl) else 0.0,
+            "total_pnl": round(float(pnl.sum()), 2),
+            "return_pct": round(float(pnl.sum()) / starting_equity * 100, 2),
+            "max_drawdown_pct": round(float(((peaks - curve) / peaks).max() * 100), 2),
+            "profit_factor": round(float(pnl[pnl > 0].sum() / gross_loss), 2) if gross_loss > 0 else None,
+        }
+
+
+# --- Parameter grid sweeps across processes ---
+
+_grid_market_data = None
+
+def _init_grid_worker(market_data):
+    global _grid_market_data
+    _grid_market_data = market_data
+
+def _run_grid_job(params):
+    risk = {k: v for k, v in params.items() if k in RISK_SETTINGS}
+    analyzer_kwargs = {k: v for k, v in params.items() if k not in RISK_SETTINGS and k != "max_holding_bars"}
+    backtester = Backtester(RuleBasedAnalyzer(**analyzer_kwargs), risk,
+                            params.get("max_holding_bars"))
+    return {**params, **backtester.run(_grid_market_data)["summary"]}
+
+def run_grid(market_data, param_grid, workers=None):
+    """
+    Runs a rule-based backtest for every combination in `param_grid` across worker processes.
+
+    Args:
+        param_grid (dict): Maps parameter names to lists of values. RISK_SETTINGS keys override
+            risk settings, 'max_holding_bars' the holding limit, and anything else is passed to
+            RuleBasedAnalyzer.
+        workers (int): Worker processes; defaults to BACKTEST_SETTINGS['grid_workers'] or the CPU count.
+
+    Returns:
+        pd.DataFrame: One row of parameters plus summary metrics per combination.
+    """
+    names = list(param_grid)
+    combos = [dict(zip(names, values)) for values in itertools.product(*(param_grid[n] for n in names))]
+    workers = workers or BACKTEST_SETTINGS['grid_workers'] or os.cpu_count()
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_grid_worker,
+                             initargs=(market_data,)) as pool:
+        rows = list(pool.map(_run_grid_job, combos))
+    return pd.DataFrame(rows)
+
+
+if __name__ == "__main__":
+    from utils import setup_logging
+    from config import TRADING_SYMBOLS, BAR_STORE_SETTINGS
+    from bar_store import BarStore
+    setup_logging()
+    history = load_history(BarStore(BAR_STORE_SETTINGS['directory']), TRADING_SYMBOLS)
+    if os.path.exists(BACKTEST_SETTINGS['recording_path']):
+        analyzer = RecordedAnalyzer.load(BACKTEST_SETTINGS['recording_path'])
+    else:
+        analyzer = RuleBasedAnalyzer()
+    result = Backtester(analyzer).run(history)
+    logging.info("Backtest with %s: %s", type(analyzer).__name__, result['summary'])
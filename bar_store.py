@@ -0,0 +1,284 @@
+# /stock_bot/bar_store.py
+
+import logging
+import os
+import threading
+from contextlib import ExitStack
+import numpy as np
+import pandas as pd
+
+# Row layout of every stored bar array: one contiguous row per column.
+COLUMNS = ["Open", "High", "Low", "Close", "Volume"]
+
+# Relative change in a re-fetched bar's open beyond which the source is taken to have
+# re-adjusted its history (split or dividend) since the bar was stored.
+ADJUSTMENT_TOLERANCE = 1e-4
+
+
+class YFinanceSource:
+    """
+    Bar source backed by Yahoo Finance. Returns bars with a tz-naive index.
+    yfinance is imported on first use so runs served from a local source never load it.
+    """
+    def history(self, symbol, interval, period=None, start=None):
+        import yfinance as yf
+        ticker = yf.Ticker(symbol)
+        if start is not None:
+            df = ticker.history(start=start, interval=interval)
+        else:
+            df = ticker.history(period=period, interval=interval)
+        if not df.empty and df.index.tz is not None:
+            df.index = df.index.tz_localize(None)
+        return df
+
+    def history_many(self, symbols, interval, period=None, start=None):
+        """
+        Downloads bars for many symbols in a single bulk request.
+
+        Returns:
+            dict: Maps each symbol to its DataFrame of bars (possibly empty).
+        """
+        import yfinance as yf
+        symbols = list(symbols)
+        data = yf.download(symbols, period=None if start is not None else period, start=start,
+                           interval=interval, group_by='ticker', auto_adjust=True,
+                           threads=True, progress=False)
+        frames = {}
+        for symbol in symbols:
+            if isinstance(data.columns, pd.MultiIndex):
+                df = data[symbol] if symbol in data.columns.get_level_values(0) else pd.DataFrame(columns=COLUMNS)
+            else:
+                df = data
+            df = df.dropna(how='all')
+            if not df.empty and df.index.tz is not None:
+                df.index = df.index.tz_localize(None)
+            frames[symbol] = df
+        return frames
+
+
+class InMemorySource:
+    """
+    Local stand-in bar source that serves pre-built DataFrames, for offline runs and tests.
+
+    Args:
+        frames (dict): Maps (symbol, interval) to a DataFrame of OHLCV bars.
+    """
+    def __init__(self, frames):
+        self.frames = frames
+        self.calls = []
+
+    def history(self, symbol, interval, period=None, start=None):
+        self.calls.append((symbol, interval, period, start))
+        df = self.frames.get((symbol, interval))
+        if df is None or df.empty:
+            return pd.DataFrame(columns=COLUMNS)
+        if start is not None:
+            return df[df.index >= pd.Timestamp(start)]
+        if period is not None and period.endswith("d"):
+            return df[df.index >= df.index[-1] - pd.Timedelta(days=int(period[:-1]))]
+        return df
+
+    def history_many(self, symbols, interval, period=None, start=None):
+        return {symbol: self.history(symbol, interval, period=period, start=start) for symbol in symbols}
+
+
+class BarStore:
+    """
+    On-disk OHLCV store keyed by symbol and interval, with incremental updates.
+
+    Each series is a single (6, n) float64 .npy file: row 0 holds the bar timestamps in
+    epoch seconds and rows 1-5 hold Open, High, Low, Close and Volume. Reads open the file
+    memory-mapped, so fetching the last N bars only pages in and copies those N bars.
+    """
+    def __init__(self, directory, source=None):
+        self.directory = directory
+        self.source = source or YFinanceSource()
+        self._locks = {}
+        self._locks_guard = threading.Lock()
+        # (symbol, interval, period) of every full-period download made in this process.
+        self._backfilled = set()
+        os.makedirs(self.directory, exist_ok=True)
+
+    def _path(self, symbol, interval):
+        return os.path.join(self.directory, f"{symbol}_{interval}.npy")
+
+    def _lock(self, symbol, interval):
+        with self._locks_guard:
+            return self._locks.setdefault((symbol, interval), threading.Lock())
+
+    def _load_array(self, symbol, interval):
+        path = self._path(symbol, interval)
+        if not os.path.exists(path):
+            return None
+        return np.load(path, mmap_mode='r')
+
+    @staticmethod
+    def _to_frame(array):
+        index = pd.DatetimeIndex(np.asarray(array[0]).astype('int64').astype('datetime64[s]').astype('datetime64[ns]'))
+        return pd.DataFrame({col: np.asarray(array[i + 1]) for i, col in enumerate(COLUMNS)}, index=index)
+
+    @staticmethod
+    def _to_array(df):
+        seconds = df.index.values.astype('datetime64[s]').astype('int64').astype('float64')
+        return np.vstack([seconds] + [df[col].to_numpy(dtype='float64') for col in COLUMNS])
+
+    def last_timestamp(self, symbol, interval):
+        """Returns the timestamp of the newest stored bar, or None if nothing is stored."""
+        array = self._load_array(symbol, interval)
+        if array is None or array.shape[1] == 0:
+            return None
+        return pd.Timestamp(int(array[0, -1]), unit='s')
+
+    def read(self, symbol, interval, last_n=None):
+        """
+        Reads stored bars as a DataFrame without touching the network.
+
+        Args:
+            last_n (int): Only return the newest `last_n` bars.
+
+        Returns:
+            pd.DataFrame: The stored bars, or None if nothing is stored.
+        """
+        array = self._load_array(symbol, interval)
+        if array is None:
+            return None
+        if last_n is not None:
+            array = array[:, -last_n:]
+        return self._to_frame(array)
+
+    def write(self, symbol, interval, df):
+        """Atomically replaces the stored series with `df`."""
+        path = self._path(symbol, interval)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            np.save(f, self._to_array(df))
+        os.replace(tmp_path, path)
+
+    def _load_full(self, symbol, interval):
+        # Load fully rather than memory-mapped so the file can be replaced afterwards.
+        path = self._path(symbol, interval)
+        if not os.path.exists(path):
+            return None
+        stored = self._to_frame(np.load(path))
+        return stored if not stored.empty else None
+
+    @staticmethod
+    def _readjusted(stored, fresh):
+        """
+        Whether the source's prices no longer match the stored ones, e.g. after a split or a
+        dividend re-adjusted its history. Compares the opens of the bars present in both:
+        an open is fixed once the bar starts forming, while an adjustment rescales it.
+        """
+        if stored is None or fresh is None or fresh.empty:
+            return False
+        overlap = stored.index.intersection(fresh.index)
+        if overlap.empty:
+            return False
+        before = stored.loc[overlap, "Open"].to_numpy(dtype='float64')
+        after = fresh.loc[overlap, "Open"].to_numpy(dtype='float64')
+        return not np.allclose(before, after, rtol=ADJUSTMENT_TOLERANCE, atol=0.0)
+
+    def _merge(self, symbol, interval, stored, fresh):
+        """Merges freshly downloaded bars into the stored ones and writes the result."""
+        if fresh is None or fresh.empty:
+            return 0
+        fresh = fresh[COLUMNS]
+
+        if stored is None:
+            merged = fresh
+            added = len(fresh)
+        else:
+            last_ts = stored.index[-1]
+            merged = pd.concat([stored[stored.index < fresh.index[0]], fresh])
+            added = int((fresh.index > last_ts).sum())
+        merged = merged[~merged.index.duplicated(keep='last')].sort_index()
+        self.write(symbol, interval, merged)
+        logging.info("Bar store updated %s %s: %s new bars, %s stored.", symbol, interval, added, len(merged))
+        return added
+
+    def _needs_history(self, symbol, interval, period, stored, min_bars):
+        """
+        Whether the full period must be downloaded: nothing is stored yet, or fewer than
+        `min_bars` bars are, e.g. because the series was first stored for a shorter period.
+        Each period is downloaded at most once per series and process; if the source has no
+        older bars, later updates stay incremental, and if it has no bars at all, later updates
+        skip the series.
+        """
+        if stored is None:
+            if (symbol, interval, period) in self._backfilled:
+                return False
+            self._backfilled.add((symbol, interval, period))
+            return True
+        if min_bars is None or len(stored) >= min_bars or (symbol, interval, period) in self._backfilled:
+            return False
+        logging.info("Bar store has %s %s bars for %s, needs %s. Backfilling...",
+                     len(stored), interval, symbol, min_bars)
+        self._backfilled.add((symbol, interval, period))
+        return True
+
+    def update(self, symbol, interval, period, min_bars=None):
+        """
+        Brings the stored series up to date and returns the number of new bars.
+
+        The first call downloads `period` of history, as does a call that needs more than the
+        `min_bars` bars stored. Later calls only request bars from the newest stored timestamp
+        onwards; that last bar is re-fetched because it may still have been forming when it was stored.
+        If the re-fetched bar's prices show the source re-adjusted its history, the stored series is
+        replaced by a fresh download of `period`.
+        """
+        with self._lock(symbol, interval):
+            stored = self._load_full(symbol, interval)
+            if self._needs_history(symbol, interval, period, stored, min_bars):
+                logging.info("Bar store downloading %s of %s history for %s...", period, interval, symbol)
+                fresh = self.source.history(symbol, interval, period=period)
+            elif stored is None:
+                return 0
+            else:
+                fresh = self.source.history(symbol, interval, start=stored.index[-1])
+                if self._readjusted(stored, fresh):
+                    logging.warning("Stored %s prices for %s no longer match the source "
+                                    "(split or dividend adjustment). Re-downloading %s of history...",
+                                    interval, symbol, period)
+                    stored, fresh = None, self.source.history(symbol, interval, period=period)
+            return self._merge(symbol, interval, stored, fresh)
+
+    def update_many(self, symbols, interval, period, min_bars=None):
+        """
+        Brings several series up to date with bulk requests to the source.
+
+        Symbols with nothing stored yet, or fewer than `min_bars` bars, get the full `period`
+        in one request; the rest are updated in another that starts at the oldest of their
+        newest stored timestamps. Series whose re-fetched bars show the source re-adjusted
+        its history are replaced by a further bulk download of `period`.
+
+        Returns:
+            dict: Maps each symbol to the number of new bars stored.
+        """
+        symbols = list(symbols)
+        with ExitStack() as stack:
+            for symbol in sorted(set(symbols)):
+                stack.enter_context(self._lock(symbol, interval))
+            stored = {symbol: self._load_full(symbol, interval) for symbol in symbols}
+            backfill = [symbol for symbol in symbols
+                        if self._needs_history(symbol, interval, period, stored[symbol], min_bars)]
+            incremental = [symbol for symbol in symbols if symbol not in backfill and stored[symbol] is not None]
+            fresh = {}
+            if backfill:
+                logging.info("Bar store downloading %s of %s history for %s symbols...", period, interval, len(backfill))
+                fresh.update(self.source.history_many(backfill, interval, period=period))
+            if incremental:
+                start = min(stored[symbol].index[-1] for symbol in incremental)
+                fresh.update(self.source.history_many(incremental, interval, start=start))
+                readjusted = [symbol for symbol in incremental if self._readjusted(stored[symbol], fresh.get(symbol))]
+                if readjusted:
+                    logging.warning("Stored %s prices for %s no longer match the source "
+                                    "(split or dividend adjustment). Re-downloading %s of history...",
+                                    interval, ', '.join(readjusted), period)
+                    fresh.update(self.source.history_many(readjusted, interval, period=period))
+                    stored.update({symbol: None for symbol in readjusted})
+            return {symbol: self._merge(symbol, interval, stored[symbol], fresh.get(symbol)) for symbol in symbols}
+
+    def get_bars(self, symbol, interval, period, last_n=None):
+        """Updates the series from the source, then returns the newest `last_n` stored bars."""
+        self.update(symbol, interval, period, min_bars=last_n)
+        return self.read(symbol, interval, last_n=last_n)
@@ -0,0 +1,382 @@
+# /stock_bot/benchmark.py
+
+import argparse
+import hashlib
+import json
+import logging
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import numpy as np
+import pandas as pd
+from config import BENCHMARK_SETTINGS
+
+# Stage means that moved by less than this are treated as noise when comparing with the baseline.
+MIN_STAGE_DELTA_MS = 5.0
+
+# Hourly bar open times of a regular US session, as yfinance reports them.
+SESSION_HOURS = [pd.Timedelta(hours=9, minutes=30) + pd.Timedelta(hours=h) for h in range(7)]
+
+
+# --- Local stand-ins for Yahoo Finance and the chat-completions API ---
+
+def synthetic_bars(symbols, sessions, seed=0):
+    """
+    Builds reproducible 1h and 1d OHLCV bars for an InMemorySource.
+
+    Closes follow a mean-reverting walk around 100, so the fixed S/R levels returned by
+    FakeChatCompletionsServer always bracket the price and trades can be sized.
+
+    Returns:
+        dict: Maps (symbol, interval) to a DataFrame, for '1h' and '1d'.
+    """
+    rng = np.random.default_rng(seed)
+    days = pd.bdate_range(end="2024-12-31", periods=sessions)
+    hourly_index = pd.DatetimeIndex([day + hour for day in days for hour in SESSION_HOURS])
+    shocks = rng.normal(0, 0.4, (len(symbols), len(hourly_index)))
+    closes = np.empty(shocks.shape)
+    closes[:, 0] = 100.0
+    for t in range(1, closes.shape[1]):
+        closes[:, t] = closes[:, t - 1] + 0.02 * (100.0 - closes[:, t - 1]) + shocks[:, t]
+    opens = np.concatenate([closes[:, :1], closes[:, :-1]], axis=1)
+    wicks = rng.uniform(0, 0.3, (2,) + closes.shape)
+
+    frames = {}
+    for row, symbol in enumerate(symbols):
+        hourly = pd.DataFrame({
+            'Open': opens[row], 'High': np.maximum(opens[row], closes[row]) + wicks[0, row],
+            'Low': np.minimum(opens[row], closes[row]) - wicks[1, row], 'Close': closes[row],
+            'Volume': rng.integers(1e5, 1e6, len(hourly_index)).astype('float64'),
+        }, index=hourly_index)
+        sessions_of = hourly.groupby(hourly.index.normalize())
+        frames[(symbol, '1h')] = hourly
+        frames[(symbol, '1d')] = pd.DataFrame({
+            'Open': sessions_of['Open'].first(), 'High': sessions_of['High'].max(),
+            'Low': sessions_of['Low'].min(), 'Close': sessions_of['Close'].last(),
+            'Volume': sessions_of['Volume'].sum()})
+    return frames
+
+
+def _fake_analysis(digest):
+    """A valid VLM_PROMPT-style answer whose sentiment is derived from the image digest."""
+    sentiment = ["Bullish", "Bearish", "Neutral"][digest[0] % 3]
+    return {
+        "candlestick_patterns": [], "chart_patterns": [],
+        "support_resistance": {
+            "support": [{"level": level, "type": "horizontal", "strength": "moderate"} for level in (97.0, 90.0, 50.0)],
+            "resistance": [{"level": level, "type": "horizontal", "strength": "moderate"} for level in (103.0, 110.0, 150.0)],
+        },
+        "trend_analysis": {"direction": "Sideways", "strength": "weak", "details": "Synthetic benchmark data."},
+        "indicator_analysis": {"rsi": {"value": 50, "status": "neutral"}, "macd": {"status": "flat"},
+                               "bollinger_bands": {"status": "normal"}},
+        "technical_sentiment": {"sentiment": sentiment, "confidence": "medium", "reasoning": "Benchmark stand-in response."},
+    }
+
+
+class FakeChatCompletionsServer:
+    """
+    Local HTTP stand-in for POST /chat/completions that answers after a configurable delay.
+    Point VLM_CLIENT_SETTINGS["base_url"] at `url` to use it.
+
+    The jitter and the answer are derived from the image, so the same chart always gets the
+    same response after the same delay and repeated runs stay comparable. Requests with several
+    labelled images (VLMTechnicalAnalyzer.analyze_charts) get one answer keyed by symbol and
+    timeframe.
+    """
+    def __init__(self, latency_seconds, jitter_seconds=0.0, host="127.0.0.1", port=0):
+        self.latency_seconds = latency_seconds
+        self.jitter_seconds = jitter_seconds
+        self.requests = 0
+        self.bytes_received = 0
+        self._lock = threading.Lock()
+        self._httpd = ThreadingHTTPServer((host, port), self._handler_class())
+        self._httpd.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+                with server._lock:
+                    server.requests += 1
+                    server.bytes_received += len(body)
+                try:
+                    content = json.loads(body)['messages'][0]['content']
+                    # Each image with the text part right before it, which labels it in batched requests.
+                    images = [(content[i - 1].get('text', ''), part['image_url']['url'])
+                              for i, part in enumerate(content) if part.get('type') == 'image_url']
+                    if not images:
+                        raise ValueError("no image")
+                except (ValueError, KeyError, IndexError, TypeError, AttributeError):
+                    self._reply(400, {"error": {"message": "Expected a chat request with at least one image."}})
+                    return
+                digests = [hashlib.sha256(image_url.encode('utf-8')).digest() for _, image_url in images]
+                time.sleep(server.latency_seconds + server.jitter_seconds * max(digest[1] for digest in digests) / 255)
+                if len(images) == 1:
+                    answer = _fake_analysis(digests[0])
+                else:
+                    answer = {}
+                    for (label, _), digest in zip(images, digests):
+                        symbol, _, timeframe = label.partition(" ")
+                        answer.setdefault(symbol, {})[timeframe] = _fake_analysis(digest)
+                self._reply(200, {"object": "chat.completion",
+                                  "choices": [{"index": 0, "finish_reason": "stop",
+                                               "message": {"role": "assistant", "content": json.dumps(answer)}}]})
+
+            def _reply(self, status, payload):
+                data = json.dumps(payload).encode('utf-8')
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def start(self):
+        self._thread = threading.Thread(target=self._httpd.serve_forever, name="fake-vlm", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+
+# --- Measurement ---
+
+class StageTimer:
+    """
+    Thread-safe wall-clock durations per pipeline stage. A wrapped call made from inside
+    another call of the same stage on the same thread (e.g. a batch's single-chart
+    fallbacks) is part of the outer call's duration and is not recorded again.
+    """
+    def __init__(self):
+        self.durations = {}
+        self._lock = threading.Lock()
+        self._active = threading.local()
+
+    def wrap(self, stage, func):
+        def timed(*args, **kwargs):
+            active = self._active.__dict__.setdefault("stages", set())
+            if stage in active:
+                return func(*args, **kwargs)
+            active.add(stage)
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                active.discard(stage)
+                with self._lock:
+                    self.durations.setdefault(stage, []).append(time.perf_counter() - start)
+        return timed
+
+    def summary(self):
+        with self._lock:
+            return {stage: {"calls": len(values),
+                            "total_seconds": round(float(np.sum(values)), 3),
+                            "mean_ms": round(float(np.mean(values)) * 1000, 1),
+                            "p95_ms": round(float(np.percentile(values, 95)) * 1000, 1)}
+                    for stage, values in self.durations.items()}
+
+
+def _peak_rss_mb(render_service=None):
+    """Peak resident memory of this process and of its largest render worker, in MB."""
+    try:
+        import resource
+    except ImportError:  # Not available on Windows
+        return None, None
+    # ru_maxrss is in KB on Linux and in bytes on macOS.
+    unit = 1024 * 1024 if sys.platform == 'darwin' else 1024
+    worker_peak = max(render_service.worker_peak_rss()) if render_service else 0
+    return (round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / unit, 1),
+            round(worker_peak / unit, 1))
+
+
+def run_scenario(num_symbols, vlm_url, sessions):
+    """
+    Runs one cycle over `num_symbols` synthetic symbols against the VLM stand-in at `vlm_url`
+    and measures it. Meant to run in a fresh process (see _run_in_subprocess) so module state
+    and peak memory belong to this scenario alone.
+
+    Returns:
+        dict: End-to-end time, throughput, per-stage timings, peak memory and signal counts.
+    """
+    import config
+    import vlm_analyzer
+    import orchestrator
+    import chart_generator
+    from bar_store import BarStore, InMemorySource
+
+    # Every request goes to the local server, unthrottled and uncached, so each run does the same work.
+    vlm_analyzer.OPENAI_API_KEY = "sk-benchmark"
+    config.VLM_CLIENT_SETTINGS.update({"base_url": vlm_url, "requests_per_minute": 10 ** 6,
+                                       "tokens_per_minute": 10 ** 9})
+    config.ANALYSIS_CACHE_SETTINGS['enabled'] = False
+    config.BAR_STORE_SETTINGS['enabled'] = True
+    symbols = [f"SYM{i:03d}" for i in range(num_symbols)]
+    store_dir = tempfile.mkdtemp(prefix="benchmark_bars_")
+    chart_generator.set_bar_store(BarStore(store_dir, source=InMemorySource(synthetic_bars(symbols, sessions))))
+
+    timer = StageTimer()
+    orchestrator.fetch_market_data = timer.wrap("fetch", orchestrator.fetch_market_data)
+    orchestrator.fetch_universe_data = timer.wrap("fetch", orchestrator.fetch_universe_data)
+    start = time.perf_counter()
+    bot = orchestrator.CentralOrchestrationModule()
+    startup_seconds = time.perf_counter() - start
+    bot._render = timer.wrap("render", bot._render)
+    bot.vlm_analyzer.analyze_chart = timer.wrap("vlm", bot.vlm_analyzer.analyze_chart)
+    # Batched requests count as one vlm call each, including any single-chart fallbacks.
+    bot.vlm_analyzer.analyze_charts = timer.wrap("vlm", bot.vlm_analyzer.analyze_charts)
+    bot._finish_cycle = timer.wrap("decide", bot._finish_cycle)
+    bot._execute_trade = timer.wrap("order_submit", bot._execute_trade)
+    try:
+        start = time.perf_counter()
+        results = bot.run_cycles(symbols)
+        cycle_seconds = time.perf_counter() - start
+        # Queued orders still count towards the run.
+        bot.trade_executor.close()
+        drain_seconds = time.perf_counter() - start
+        peak_rss_mb, peak_child_rss_mb = _peak_rss_mb(bot.render_service)
+    finally:
+        bot.close()
+    return {
+        "symbols": num_symbols,
+        "startup_seconds": round(startup_seconds, 3),
+        "end_to_end_seconds": round(cycle_seconds, 3),
+        "symbols_per_minute": round(num_symbols / cycle_seconds * 60, 1),
+        "stages": timer.summary(),
+        # Time from the end of the cycles until the last queued order was confirmed
+        "order_drain_seconds": round(drain_seconds - cycle_seconds, 3),
+        "orders": bot.trade_executor.stats(),
+        "peak_rss_mb": peak_rss_mb,
+        "peak_child_rss_mb": peak_child_rss_mb,
+        "signals": {signal: sum(r['signal'] == signal for r in results)
+                    for signal in ("BUY", "SELL", "HOLD", None)},
+    }
+
+
+def _run_in_subprocess(num_symbols, vlm_url, sessions):
+    command = [sys.executable, os.path.abspath(__file__), "--scenario",
+               json.dumps({"num_symbols": num_symbols, "vlm_url": vlm_url, "sessions": sessions})]
+    completed = subprocess.run(command, capture_output=True, text=True,
+                               cwd=os.path.dirname(os.path.abspath(__file__)))
+    if completed.returncode != 0:
+        raise RuntimeError(f"Benchmark scenario with {num_symbols} symbols failed:\n{completed.stderr}")
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+
+def run_suite(symbol_counts, latency_seconds, jitter_seconds, sessions):
+    """Runs every scenario against one shared VLM stand-in and returns the combined results."""
+    server = FakeChatCompletionsServer(latency_seconds, jitter_seconds).start()
+    try:
+        scenarios = {}
+        for count in symbol_counts:
+            logging.info("Benchmarking %s symbols...", count)
+            scenarios[str(count)] = _run_in_subprocess(count, server.url, sessions)
+            logging.info("%s symbols: %ss end to end, %s symbols/min.", count,
+                         scenarios[str(count)]['end_to_end_seconds'], scenarios[str(count)]['symbols_per_minute'])
+    finally:
+        server.stop()
+    return {
+        "created_at": datetime.now().isoformat(timespec='seconds'),
+        "settings": {"vlm_latency_seconds": latency_seconds, "vlm_latency_jitter_seconds": jitter_seconds,
+                     "sessions": sessions},
+        "vlm_requests": server.requests,
+        "vlm_bytes_received": server.bytes_received,
+        "scenarios": scenarios,
+    }
+
+
+# --- Baselines ---
+
+def compare_results(current, baseline, tolerance_pct):
+    """
+    Lists the metrics that got worse than the baseline by more than `tolerance_pct` percent.
+    Time and memory metrics count as worse when higher, throughput when lower; stage means
+    that moved by less than MIN_STAGE_DELTA_MS are ignored.
+    """
+    regressions = []
+    limit = 1 + tolerance_pct / 100.0
+    for count, scenario in current['scenarios'].items():
+        base = baseline['scenarios'].get(count)
+        if base is None:
+            continue
+        metrics = [("end_to_end_seconds", scenario['end_to_end_seconds'], base['end_to_end_seconds'], True),
+                   ("symbols_per_minute", scenario['symbols_per_minute'], base['symbols_per_minute'], False),
+                   ("peak_rss_mb", scenario['peak_rss_mb'], base['peak_rss_mb'], True)]
+        for stage, stats in scenario['stages'].items():
+            if stage in base['stages'] and stats['mean_ms'] - base['stages'][stage]['mean_ms'] >= MIN_STAGE_DELTA_MS:
+                metrics.append((f"{stage}.mean_ms", stats['mean_ms'], base['stages'][stage]['mean_ms'], True))
+        for name, value, reference, higher_is_worse in metrics:
+            if value is None or not reference:
+                continue
+            worse = value > reference * limit if higher_is_worse else value * limit < reference
+            if worse:
+                regressions.append(f"[{count} symbols] {name}: {value} vs baseline {reference}")
+    return regressions
+
+
+def _results_path(name):
+    return os.path.join(BENCHMARK_SETTINGS['results_directory'], f"{name}.json")
+
+
+def _save(results, name):
+    os.makedirs(BENCHMARK_SETTINGS['results_directory'], exist_ok=True)
+    with open(_results_path(name), 'w', encoding='utf-8') as f:
+        json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Offline end-to-end benchmark of the analysis cycle.")
+    parser.add_argument("--symbols", default=",".join(str(n) for n in BENCHMARK_SETTINGS['symbol_counts']),
+                        help="Comma-separated symbol counts to benchmark.")
+    parser.add_argument("--latency", type=float, default=BENCHMARK_SETTINGS['vlm_latency_seconds'])
+    parser.add_argument("--jitter", type=float, default=BENCHMARK_SETTINGS['vlm_latency_jitter_seconds'])
+    parser.add_argument("--save-baseline", action="store_true", help="Store this run as the new baseline.")
+    parser.add_argument("--scenario", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.scenario:
+        # Child process: run one scenario quietly and print its results as the last stdout line.
+        logging.basicConfig(level=logging.WARNING)
+        print(json.dumps(run_scenario(**json.loads(args.scenario))))
+        sys.exit(0)
+
+    from utils import setup_logging
+    setup_logging()
+    results = run_suite([int(n) for n in args.symbols.split(",")], args.latency, args.jitter,
+                        BENCHMARK_SETTINGS['sessions'])
+    _save(results, "latest")
+    logging.info("Benchmark results: %s", json.dumps(results['scenarios']))
+
+    if args.save_baseline:
+        _save(results, "baseline")
+        logging.info("Saved benchmark baseline to %s.", _results_path('baseline'))
+    elif os.path.exists(_results_path("baseline")):
+        with open(_results_path("baseline"), 'r', encoding='utf-8') as f:
+            regressions = compare_results(results, json.load(f), BENCHMARK_SETTINGS['regression_tolerance_pct'])
+        for regression in regressions:
+            logging.warning("Benchmark regression %s", regression)
+        if regressions:
+            sys.exit(1)
+        logging.info("No regressions against the benchmark baseline.")
+    else:
+        logging.info("No benchmark baseline yet; run with --save-baseline to create one.")
@@ -1,88 +1,214 @@
 # /stock_bot/chart_generator.py
 
+import io
 import pandas as pd
-import mplfinance as mpf
 import logging
-import yfinance as yf
+from bar_store import BarStore, YFinanceSource
+from indicator_engine import compute_indicators
+from image_encoder import encode_for_upload, log_encoding
+import telemetry
+from config import BAR_STORE_SETTINGS, IMAGE_ENCODING_SETTINGS
 # We no longer import INDICATOR_SETTINGS from config here
 
+_bar_store = None
+
+def get_bar_store():
+    """Returns the shared on-disk bar store, creating it on first use."""
+    global _bar_store
+    if _bar_store is None:
+        _bar_store = BarStore(BAR_STORE_SETTINGS['directory'])
+    return _bar_store
+
+def set_bar_store(store):
+    """Replaces the shared bar store, e.g. with one backed by a local stand-in source."""
+    global _bar_store
+    _bar_store = store
+
+# 4H bars are built from 1h bars. Bins are anchored at the 09:30 US session open so each
+# regular session yields a 09:30-13:30 bar and a 13:30-16:00 bar.
+FOUR_HOUR_RULE = '4h'
+FOUR_HOUR_OFFSET = '9h30min'
+
+def _download_params(resolution, num_points):
+    """Maps a chart resolution to the yfinance interval, history period and raw bars needed."""
+    if resolution == '240':
+        # Up to four 1h bars make one 4H bar; one extra bin absorbs a partial leading bin.
+        return '1h', "720d", (num_points + 1) * 4
+    return '1d', f"{int(num_points * 1.5)}d", num_points
+
+def resample_bars(df, rule=FOUR_HOUR_RULE, offset=FOUR_HOUR_OFFSET):
+    """Aggregates OHLCV bars into a coarser timeframe, dropping bins with no trading."""
+    aggregated = df.resample(rule, origin='start_day', offset=offset).agg(
+        {'Open': 'first', 'High': 'max', 'Low': 'min', 'Close': 'last', 'Volume': 'sum'})
+    return aggregated.dropna(subset=['Close'])
+
+def _shape_bars(df, resolution, num_points):
+    """Turns raw downloaded bars into the last `num_points` bars of the chart resolution."""
+    if resolution == '240':
+        df = resample_bars(df)
+    return df.tail(num_points)
+
 def fetch_market_data(symbol, resolution, num_points):
     # ... (This function remains exactly the same as the previous version) ...
-    logging.info(f"Fetching {num_points} data points for {symbol} with {resolution} resolution from Yahoo Finance...")
-    try:
-        interval = '1d'
-        if resolution == '240':
-            interval = '1h'
-            logging.warning(f"yfinance does not support '4h' interval. Using '1h' as the closest alternative for {symbol}.")
-        period_to_fetch = f"{int(num_points * 1.5)}d"
-        if interval == '1h':
-            period_to_fetch = "720d"
-        ticker = yf.Ticker(symbol)
-        df = ticker.history(period=period_to_fetch, interval=interval)
-        if df.empty:
-            logging.error(f"yfinance returned no data for {symbol}.")
+    with telemetry.span("fetch", symbol=symbol, resolution=resolution):
+        logging.info("Fetching %s data points for %s with %s resolution from Yahoo Finance...", num_points, symbol, resolution)
+        try:
+            interval, period_to_fetch, raw_points = _download_params(resolution, num_points)
+            if BAR_STORE_SETTINGS['enabled']:
+                df = get_bar_store().get_bars(symbol, interval, period_to_fetch, last_n=raw_points)
+                if df is None or df.empty:
+                    logging.error("Bar store has no data for %s.", symbol)
+                    telemetry.increment("failures", stage="fetch")
+                    return None
+            else:
+                import yfinance as yf
+                ticker = yf.Ticker(symbol)
+                df = ticker.history(period=period_to_fetch, interval=interval)
+                if df.empty:
+                    logging.error("yfinance returned no data for %s.", symbol)
+                    telemetry.increment("failures", stage="fetch")
+                    return None
+                df.index = df.index.tz_localize(None)
+            df = _shape_bars(df, resolution, num_points)
+            logging.info("Successfully fetched %s data points for %s.", len(df), symbol)
+            return df
+        except Exception as e:
+            logging.error("An unexpected error occurred during data fetching for %s with yfinance: %s", symbol, e, exc_info=True)
+            telemetry.increment("failures", stage="fetch")
             return None
-        df.index = df.index.tz_localize(None)
-        df = df.tail(num_points)
-        logging.info(f"Successfully fetched {len(df)} data points for {symbol}.")
-        return df
-    except Exception as e:
-        logging.error(f"An unexpected error occurred during data fetching for {symbol} with yfinance: {e}", exc_info=True)
-        return None
+
+def fetch_universe_data(symbols, chart_settings):
+    """
+    Fetches every symbol's bars with one bulk request per interval.
+
+    Args:
+        symbols (list): Stock symbols to load.
+        chart_settings (dict): Maps a timeframe name to its "resolution" and "num_points",
+            as in GENERIC_CHART_SETTINGS.
+
+    Returns:
+        dict: {symbol: {timeframe: DataFrame}}. Timeframes without data are left out.
+    """
+    symbols = list(symbols)
+    market_data = {symbol: {} for symbol in symbols}
+    for timeframe, settings in chart_settings.items():
+        resolution, num_points = settings['resolution'], settings['num_points']
+        interval, period_to_fetch, raw_points = _download_params(resolution, num_points)
+        logging.info("Fetching %s bars for %s symbols in one batch (%s interval)...", timeframe, len(symbols), interval)
+        try:
+            with telemetry.span("fetch_batch", timeframe=timeframe, symbols=len(symbols)):
+                if BAR_STORE_SETTINGS['enabled']:
+                    store = get_bar_store()
+                    store.update_many(symbols, interval, period_to_fetch, min_bars=raw_points)
+                    frames = {symbol: store.read(symbol, interval, last_n=raw_points) for symbol in symbols}
+                else:
+                    frames = YFinanceSource().history_many(symbols, interval, period=period_to_fetch)
+        except Exception as e:
+            logging.error("Batch download of %s bars failed: %s", timeframe, e, exc_info=True)
+            telemetry.increment("failures", len(symbols), stage="fetch")
+            continue
+
+        for symbol in symbols:
+            df = frames.get(symbol)
+            if df is None or df.empty:
+                logging.error("Batch download returned no %s data for %s.", timeframe, symbol)
+                telemetry.increment("failures", stage="fetch")
+                continue
+            market_data[symbol][timeframe] = _shape_bars(df, resolution, num_points)
+    return market_data
 
 # --- FIX: This function now accepts indicator settings as an argument ---
 def _calculate_indicators(df, indicator_settings):
     """Calculates and adds technical indicators to the dataframe based on provided settings."""
-    for ma in indicator_settings['moving_averages']:
-        df[f'MA_{ma}'] = df['Close'].rolling(window=ma).mean()
-    delta = df['Close'].diff()
-    gain = (delta.where(delta > 0, 0)).rolling(window=indicator_settings['rsi_period']).mean()
-    loss = (-delta.where(delta < 0, 0)).rolling(window=indicator_settings['rsi_period']).mean()
-    rs = gain / loss
-    df['RSI'] = 100 - (100 / (1 + rs))
-    exp1 = df['Close'].ewm(span=indicator_settings['macd_fast'], adjust=False).mean()
-    exp2 = df['Close'].ewm(span=indicator_settings['macd_slow'], adjust=False).mean()
-    df['MACD'] = exp1 - exp2
-    df['MACD_Signal'] = df['MACD'].ewm(span=indicator_settings['macd_signal'], adjust=False).mean()
-    df['MACD_Hist'] = df['MACD'] - df['MACD_Signal']
-    ma_bb = df['Close'].rolling(window=indicator_settings['bollinger_period']).mean()
-    std_dev = df['Close'].rolling(window=indicator_settings['bollinger_period']).std()
-    df['BB_Upper'] = ma_bb + (std_dev * indicator_settings['bollinger_dev'])
-    df['BB_Lower'] = ma_bb - (std_dev * indicator_settings['bollinger_dev'])
+    with telemetry.span("indicators"):
+        indicators = compute_indicators(df['Close'].to_numpy(dtype='float64'), indicator_settings)
+    for column, values in indicators.items():
+        df[column] = values[0]
     return df
 
-# --- FIX: This function now accepts indicator settings as an argument ---
-def generate_chart_image(symbol, resolution, num_points, title, file_path, indicator_settings):
+def prepare_chart_data(df, symbol, indicator_settings):
     """
-    Fetches real data from yfinance, generates, and saves a chart image.
+    Adds indicators to market data and drops the warm-up rows without full indicator values.
+    Returns None if no rows are left.
+    """
+    df_with_indicators = _calculate_indicators(df.copy(), indicator_settings).dropna()
+
+    # Add a check to ensure the dataframe is not empty AFTER dropping NaNs
+    if df_with_indicators.empty:
+        logging.error("DataFrame for %s became empty after indicator calculation. Not enough data points for the given indicators.", symbol)
+        return None
+    return df_with_indicators
+
+def plot_chart(df_with_indicators, title, indicator_settings, target, style='yahoo'):
+    """Plots bars that already carry indicator columns and saves the PNG to `target` (a path or buffer)."""
+    # Imported on first use: with the render pool enabled only the workers ever plot.
+    import mplfinance as mpf
+    ap = [
+        mpf.make_addplot(df_with_indicators[[f'MA_{ma}' for ma in indicator_settings['moving_averages']]]),
+        mpf.make_addplot(df_with_indicators[['BB_Upper', 'BB_Lower']], color='grey', alpha=0.3),
+        mpf.make_addplot(df_with_indicators[['MACD', 'MACD_Signal']], panel=2, ylabel='MACD'),
+        mpf.make_addplot(df_with_indicators['MACD_Hist'], type='bar', panel=2, color='dimgray', alpha=0.7),
+        mpf.make_addplot(df_with_indicators['RSI'], panel=3, ylabel='RSI', y_on_right=False),
+    ]
+    mpf.plot(df_with_indicators, type='candle', style=style, title=title, ylabel='Price (USD)',
+             volume=True, volume_panel=1, panel_ratios=(6, 2, 2, 2), addplot=ap,
+             figsize=(15, 10), savefig=dict(fname=target, format='png', dpi=IMAGE_ENCODING_SETTINGS['render_dpi'],
+                                             pad_inches=0.25))
+
+def save_chart_bytes(image_bytes, file_path):
+    """Writes rendered PNG bytes to `file_path`, used as an optional debug sink."""
+    with open(file_path, 'wb') as f:
+        f.write(image_bytes)
+
+def render_chart(df, symbol, resolution, title, file_path, indicator_settings, as_bytes=False):
+    """
+    Adds indicators to already-fetched market data and saves the chart image.
+    Returns the file path, or None if the chart could not be rendered.
+
+    With `as_bytes`, the chart is rendered into memory and the PNG bytes are returned
+    instead, compacted for upload when IMAGE_ENCODING_SETTINGS is enabled. `file_path` is
+    then optional and, if given, receives a copy of the chart as rendered for debugging.
     """
     try:
-        logging.info(f"Creating chart for {symbol} ({resolution} resolution)...")
-        df = fetch_market_data(symbol, resolution, num_points)
-        if df is None or df.empty:
-            logging.error(f"No data fetched for {symbol}, cannot generate chart.")
-            return None, None
-        
-        df_with_indicators = _calculate_indicators(df.copy(), indicator_settings).dropna()
-        
-        # Add a check to ensure the dataframe is not empty AFTER dropping NaNs
-        if df_with_indicators.empty:
-            logging.error(f"DataFrame for {symbol} became empty after indicator calculation. Not enough data points for the given indicators.")
-            return None, None
-
-        ap = [
-            mpf.make_addplot(df_with_indicators[[f'MA_{ma}' for ma in indicator_settings['moving_averages']]]),
-            mpf.make_addplot(df_with_indicators[['BB_Upper', 'BB_Lower']], color='grey', alpha=0.3),
-            mpf.make_addplot(df_with_indicators[['MACD', 'MACD_Signal']], panel=2, ylabel='MACD'),
-            mpf.make_addplot(df_with_indicators['MACD_Hist'], type='bar', panel=2, color='dimgray', alpha=0.7),
-            mpf.make_addplot(df_with_indicators['RSI'], panel=3, ylabel='RSI', y_on_right=False),
-        ]
-        mpf.plot(df_with_indicators, type='candle', style='yahoo', title=title, ylabel='Price (USD)',
-                 volume=True, volume_panel=1, panel_ratios=(6, 2, 2, 2), addplot=ap,
-                 figsize=(15, 10), savefig=dict(fname=file_path, dpi=100, pad_inches=0.25))
-        logging.info(f"Chart for {symbol} saved successfully to {file_path}")
-        return file_path, df
+        logging.info("Creating chart for %s (%s resolution)...", symbol, resolution)
+        df_with_indicators = prepare_chart_data(df, symbol, indicator_settings)
+        if df_with_indicators is None:
+            return None
+
+        target = io.BytesIO() if as_bytes else file_path
+        with telemetry.span("render", symbol=symbol):
+            plot_chart(df_with_indicators, title, indicator_settings, target)
+        if not as_bytes:
+            logging.info("Chart for %s saved successfully to %s", symbol, file_path)
+            return file_path
+
+        image_bytes = target.getvalue()
+        if file_path:
+            save_chart_bytes(image_bytes, file_path)
+        logging.info("Chart for %s rendered in memory (%s bytes).", symbol, len(image_bytes))
+        # Compacted here rather than in the VLM stage, so the upload is ready when the chart is.
+        image_bytes, stats, error = encode_for_upload(image_bytes)
+        log_encoding(symbol, stats, error)
+        return image_bytes
         
     except Exception as e:
-        logging.error(f"Failed to generate chart image for {symbol}: {e}", exc_info=True)
-        return None, None
\ No newline at end of file
+        logging.error("Failed to generate chart image for %s: %s", symbol, e, exc_info=True)
+        telemetry.increment("failures", stage="render")
+        return None
+
+# --- FIX: This function now accepts indicator settings as an argument ---
+def generate_chart_image(symbol, resolution, num_points, title, file_path, indicator_settings, df=None):
+    """
+    Fetches real data from yfinance, generates, and saves a chart image.
+    Pass `df` to chart bars that were already loaded, e.g. by fetch_universe_data.
+    """
+    if df is None:
+        df = fetch_market_data(symbol, resolution, num_points)
+    if df is None or df.empty:
+        logging.error("No data fetched for %s, cannot generate chart.", symbol)
+        return None, None
+
+    chart_path = render_chart(df, symbol, resolution, title, file_path, indicator_settings)
+    if not chart_path:
+        return None, None
+    return chart_path, df
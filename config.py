@@ -22,6 +22,24 @@ GENERIC_CHART_SETTINGS = {
     }
 }
 
+# --- Chart Output ---
+# "in_memory" renders charts to PNG bytes that go straight to the VLM analyzer.
+# "save_to_disk" additionally writes {symbol}_{timeframe}_chart.png, e.g. for debugging.
+# With in_memory off, charts are always written to disk and read back for the VLM.
+CHART_OUTPUT_SETTINGS = {
+    "in_memory": True,
+    "save_to_disk": False
+}
+
+# --- Chart Render Pool ---
+# With in-memory charts, rendering can run in a pool of warm worker processes
+# (matplotlib is not thread-safe, so threads cannot parallelise it). When enabled,
+# the "render" stage limit is raised to the number of workers.
+RENDER_SERVICE_SETTINGS = {
+    "enabled": True,
+    "workers": 4
+}
+
 # --- FIX: Timeframe-Specific Indicator Settings ---
 # Settings for the Daily chart, which can include long-term indicators
 INDICATOR_SETTINGS_DAILY = {
@@ -69,11 +87,254 @@ Provide your response *exclusively* in a valid JSON format. Do not include any t
 }
 """
 
+# Appended to VLM_PROMPT when several charts share one request (see VLM_BATCH_SETTINGS).
+VLM_BATCH_INSTRUCTIONS = """
+**Multiple Charts:**
+You will receive several charts. Each image is preceded by a label of the form "SYMBOL TIMEFRAME".
+Analyze every chart independently using the instructions above. Reply with a single JSON object that maps
+each symbol to an object mapping each of its timeframes to that chart's analysis in the format above,
+e.g. {"AAPL": {"1D": {...}, "4H": {...}}, "MSFT": {"1D": {...}}}. Do not include any text before or after the JSON block.
+"""
+
+# Vision model used for chart analysis
+VLM_MODEL = "gpt-4o-mini"
+
+# --- Universe Screener ---
+# When enabled, main.py first screens every symbol in universe_file (one per line;
+# TRADING_SYMBOLS if the file is missing) on daily bars and only sends the top_k
+# highest-scoring symbols to the chart + VLM pipeline. Each rule adds its weight to
+# the score: a trend (close and fast MA on the same side of the slow MA), RSI
+# momentum in the trend's direction (scaled, zero once overbought/oversold), a
+# MACD signal-line cross in the trend's direction within lookback_bars, and a
+# Bollinger squeeze (bandwidth at or below its lookback percentile). Pruned symbols
+# and their reasons are written to report_path.
+SCREENER_SETTINGS = {
+    "enabled": False,
+    "universe_file": "universe.txt",
+    "top_k": 20,
+    "min_score": 2.0,
+    # Daily bars loaded per symbol; symbols with fewer are pruned
+    "min_bars": 260,
+    "rules": {
+        "trend": {"weight": 2.0, "fast_ma": 50, "slow_ma": 200},
+        "rsi": {"weight": 1.0, "overbought": 70, "oversold": 30},
+        "macd_cross": {"weight": 1.0, "lookback_bars": 5},
+        "bollinger_squeeze": {"weight": 1.0, "lookback_bars": 120, "percentile": 20}
+    },
+    "report_path": "screener_report.json",
+    # How many pruned symbols to log individually (all are in the report)
+    "log_pruned": 20
+}
+
+# --- Batched VLM Requests ---
+# When enabled, the charts that are analysed at the same point of a cycle share one
+# chat-completions request, so VLM_PROMPT is sent once instead of once per chart.
+# Symbols are grouped symbols_per_request at a time. Without lazy evaluation each
+# group's daily and 4H charts go in one request; with it, the group's daily charts
+# go first and the 4H charts of the symbols with a directional bias follow in a
+# second request. Symbol groups are formed by the concurrent pipeline; serial runs
+# batch each symbol's own charts. Charts missing from a batched answer are
+# re-analysed one by one.
+VLM_BATCH_SETTINGS = {
+    "enabled": False,
+    "symbols_per_request": 4,
+    # Completion budget per chart in the request
+    "max_tokens_per_chart": 1500
+}
+
+# --- Chart Image Encoding ---
+# When enabled, every chart is re-encoded before it is uploaded to the VLM: the
+# plain margin is cropped, the chart is scaled down to fit max_width x max_height
+# and quantized to a palette of palette_colors flat colours (0 keeps full colour).
+# In-memory charts are encoded as they are rendered (in the render pool workers
+# when the pool is on); chart files saved to disk are encoded by the VLM analyzer.
+# These settings are part of the analysis cache key.
+# "detail" is the image detail level sent with each chart ("low", "high" or
+# "auto"); "low" is billed a flat 85 tokens but loses fine labels. render_dpi sets
+# the resolution charts are rendered at (figsize 15x10 inches). Bytes and
+# estimated tokens saved per chart are logged. `python image_encoder.py` checks
+# the encoding of the recorded *_chart.png files against quality_check (add --vlm
+# to also compare the VLM analyses of both versions through the API).
+IMAGE_ENCODING_SETTINGS = {
+    "enabled": True,
+    "crop_margins": True,
+    "max_width": 1024,
+    "max_height": 1024,
+    "palette_colors": 64,
+    # Extra zlib pass: ~10% smaller files for ~2x the encoding time
+    "optimize": False,
+    "detail": "high",
+    "render_dpi": 100,
+    "quality_check": {
+        # Mean absolute grayscale difference (0-255) after scaling back up
+        "max_pixel_error": 5.0,
+        # With --vlm: S/R levels within this many percent count as the same level
+        "level_tolerance_pct": 1.0,
+        "min_level_match": 0.5
+    }
+}
+
+# --- VLM HTTP Client ---
+# Connection pooling, timeouts, retries with jittered backoff on 429/5xx, and
+# per-minute request/token budgets for the chat-completions API. Point "base_url"
+# at a local server to run against a stand-in for the API.
+VLM_CLIENT_SETTINGS = {
+    "base_url": "https://api.openai.com/v1",
+    "connect_timeout": 10,
+    "read_timeout": 90,
+    "max_retries": 4,
+    "backoff_base_seconds": 1.0,
+    "backoff_max_seconds": 30.0,
+    "requests_per_minute": 500,
+    "tokens_per_minute": 200000,
+    "pool_size": 8
+}
+
+# --- VLM Analysis Cache ---
+# Analyses are cached on disk, keyed by a hash of the charted bars, indicator
+# settings, chart title, VLM_PROMPT and VLM_MODEL. An unchanged chart (outside
+# market hours, weekends, daily reruns) is answered from the cache instead of the API.
+# Daily charts are keyed on completed sessions only, so intraday reruns reuse the
+# day's analysis while today's bar is still forming.
+ANALYSIS_CACHE_SETTINGS = {
+    "enabled": True,
+    "directory": "analysis_cache",
+    "ttl_seconds": 24 * 3600,
+    "max_entries": 2000
+}
+
 # --- Risk Management Parameters ---
 RISK_SETTINGS = {
     "account_equity": 10000.00,
     "risk_per_trade_percent": 1.0,
-    "min_reward_to_risk": 2.0
+    "min_reward_to_risk": 2.0,
+    # Portfolio caps applied to all BUY/SELL signals of a run, in symbol order; a signal
+    # that only partly fits is traded at the size that does
+    "portfolio_caps": True,
+    "max_total_risk_percent": 5.0,
+    "max_sector_exposure_percent": 100.0,
+    "max_open_positions": 5
+}
+
+# Sector of each symbol for the per-sector exposure cap; unlisted symbols share "Unknown".
+SYMBOL_SECTORS = {
+    "AAPL": "Technology",
+    "NVDA": "Technology",
+    "MSFT": "Technology",
+    "GOOGL": "Communication Services"
+}
+
+# --- Local Bar Store ---
+# When enabled, fetch_market_data keeps OHLCV history on disk and only downloads
+# bars newer than the last stored one on each cycle.
+BAR_STORE_SETTINGS = {
+    "enabled": True,
+    "directory": "bar_store"
+}
+
+# --- Pipeline Concurrency ---
+# With "concurrent" enabled, main.py overlaps the data fetch, chart render and
+# VLM stages of every symbol and timeframe instead of running them one by one.
+# Each stage has its own limit on how many calls may be in flight at once.
+# Rendering is kept at 1 because matplotlib's pyplot state is not thread-safe.
+PIPELINE_SETTINGS = {
+    "concurrent": True,
+    # Download all symbols in one request per interval instead of two per symbol
+    "batch_download": True,
+    # Analyse the daily chart first and skip the 4H render/VLM call when the daily
+    # bias has no direction (such cycles always end in HOLD)
+    "lazy_evaluation": True,
+    # Optional numeric screen that also skips the daily VLM call when RSI is in the
+    # neutral band and price is within max_ma_distance_pct of the trend MA
+    "daily_precheck": {
+        "enabled": False,
+        "trend_ma": 50,
+        "rsi_neutral_band": [45, 55],
+        "max_ma_distance_pct": 1.0
+    },
+    "stage_limits": {
+        "fetch": 8,
+        "render": 1,
+        "vlm": 8
+    }
+}
+
+# --- Order Execution ---
+# Orders are queued and sent to the broker in batches by a background worker, so
+# signal generation never waits for order placement. SimulatedBroker stands in
+# for a real broker with one simulated round trip per batch.
+EXECUTION_SETTINGS = {
+    "simulated_latency_seconds": 1.0,
+    "batch_size": 10,
+    # How long the worker keeps collecting orders for a batch after the first one
+    "batch_window_seconds": 0.05
+}
+
+# --- Daemon Mode ---
+# `python main.py --daemon` keeps the bot resident and wakes at every daily/4H
+# bar close in exchange time, plus close_delay_seconds for the data to arrive.
+# Only symbols whose newest bar changed since their last completed cycle are
+# re-run; the last-seen bars are kept in state_path across restarts.
+DAEMON_SETTINGS = {
+    "exchange_timezone": "America/New_York",
+    "session_open": "09:30",
+    "session_close": "16:00",
+    "close_delay_seconds": 120,
+    "run_on_start": True,
+    "state_path": "daemon_state.json"
+}
+
+# --- Logging ---
+# With "queue" on, log calls only put their record on a queue; a background thread
+# formats it and writes it to the console and to a size-rotated log file. "json"
+# writes the file as JSON lines tagged with symbol, timeframe and cycle_id.
+LOGGING_SETTINGS = {
+    "level": "INFO",
+    "path": "trading_bot.log",
+    "queue": True,
+    "json": True,
+    "max_bytes": 10 * 1024 * 1024,
+    "backup_count": 5
+}
+
+# --- Telemetry ---
+# Per-stage timing spans (fetch, indicators, render, encode, vlm, risk, execute, cycle)
+# and counters (API calls, bytes uploaded, cache hits, failures). At the end of
+# a run spans are appended to jsonl_path and latency histograms are written in
+# Prometheus text format to prometheus_path. Disabled telemetry costs almost nothing.
+TELEMETRY_SETTINGS = {
+    "enabled": False,
+    "jsonl_path": "metrics.jsonl",
+    "prometheus_path": "metrics.prom",
+    "histogram_buckets_seconds": [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120]
+}
+
+# --- Backtesting ---
+# With "record_analyses" enabled, every VLM chart analysis is appended to
+# recording_path so backtester.RecordedAnalyzer can replay it later.
+BACKTEST_SETTINGS = {
+    "record_analyses": False,
+    "recording_path": "recorded_analyses.jsonl",
+    # Trades still open after this many 4H bars are closed at the bar's close
+    "max_holding_bars": 120,
+    # Worker processes for parameter grids (None = one per CPU core)
+    "grid_workers": None
+}
+
+# --- Benchmark ---
+# benchmark.py runs full cycles offline against synthetic bars and a local
+# stand-in for the chat-completions API, and compares each run with the
+# baseline saved in results_directory.
+BENCHMARK_SETTINGS = {
+    "symbol_counts": [4, 50, 500],
+    # Simulated VLM response time: latency plus up to jitter seconds
+    "vlm_latency_seconds": 1.0,
+    "vlm_latency_jitter_seconds": 0.5,
+    # Trading sessions of synthetic history per symbol
+    "sessions": 300,
+    "results_directory": "benchmark_results",
+    # A metric more than this much worse than the baseline counts as a regression
+    "regression_tolerance_pct": 20
 }
 
 # --- Fundamental Analysis Mock ---
@@ -0,0 +1,188 @@
+# /stock_bot/daemon.py
+
+import json
+import logging
+import os
+import signal
+import threading
+from datetime import datetime, time as dt_time, timedelta
+import pandas as pd
+from config import DAEMON_SETTINGS, TRADING_SYMBOLS, PIPELINE_SETTINGS
+from chart_generator import FOUR_HOUR_RULE
+from orchestrator import CentralOrchestrationModule
+import telemetry
+
+
+class BarCloseSchedule:
+    """
+    Bar-close times of the daily and 4H charts in exchange time.
+
+    4H bars are anchored at the session open like resample_bars, so a 09:30-16:00 session
+    closes 4H bars at 13:30 and 16:00; the daily bar closes with the session. Weekends are
+    skipped; exchange holidays simply produce no new bars and are filtered out by TradingDaemon.
+    """
+    def __init__(self, settings):
+        self.timezone = settings['exchange_timezone']
+        self.delay = timedelta(seconds=settings['close_delay_seconds'])
+        session_open = dt_time.fromisoformat(settings['session_open'])
+        session_close = dt_time.fromisoformat(settings['session_close'])
+        step = pd.Timedelta(FOUR_HOUR_RULE).to_pytimedelta()
+        anchor = datetime.combine(datetime.min.date(), session_open)
+        end = datetime.combine(datetime.min.date(), session_close)
+
+        # Each close time maps to the timeframes whose bars close then.
+        self.closes = {}
+        boundary = anchor + step
+        while boundary < end:
+            self.closes[boundary.time()] = ("4H",)
+            boundary += step
+        self.closes[session_close] = ("1D", "4H")
+
+    def next_wake(self, after):
+        """
+        Returns (wake_time, timeframes) for the first bar close after `after`, where wake_time
+        is a tz-aware exchange-time Timestamp that already includes the data delay.
+        """
+        after = pd.Timestamp(after)
+        after = after.tz_localize(self.timezone) if after.tzinfo is None else after.tz_convert(self.timezone)
+        day = after.normalize().tz_localize(None)
+        for _ in range(8):
+            if day.weekday() < 5:
+                for close_time in sorted(self.closes):
+                    wake = pd.Timestamp(datetime.combine(day.date(), close_time)).tz_localize(self.timezone) + self.delay
+                    if wake > after:
+                        return wake, self.closes[close_time]
+            day += pd.Timedelta(days=1)
+        raise RuntimeError("No session found in the coming week; check DAEMON_SETTINGS.")
+
+
+def bar_fingerprint(df):
+    """Identifies the newest bar, including a still-forming one, so any new or updated bar changes it."""
+    if df is None or df.empty:
+        return None
+    last = df.iloc[-1]
+    return [df.index[-1].isoformat(), float(last['Close']), float(last['Volume'])]
+
+
+class TradingDaemon:
+    """
+    Resident scheduler that keeps one CentralOrchestrationModule (render workers, HTTP
+    connections, bar store) warm and runs cycles at bar closes.
+
+    At every wake it refreshes the bars of all symbols and re-runs only the symbols whose
+    due timeframe has a different newest bar than at their last completed cycle. The
+    last-seen bars are saved to DAEMON_SETTINGS['state_path'] so restarts don't repeat work.
+    """
+    def __init__(self, bot_orchestrator, symbols=None, schedule=None, state_path=None):
+        self.bot = bot_orchestrator
+        self.symbols = list(symbols or TRADING_SYMBOLS)
+        self.schedule = schedule or BarCloseSchedule(DAEMON_SETTINGS)
+        self.state_path = state_path or DAEMON_SETTINGS['state_path']
+        self.last_seen = self._load_state()
+        self.stop_event = threading.Event()
+
+    def _load_state(self):
+        try:
+            with open(self.state_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, json.JSONDecodeError):
+            return {}
+
+    def _save_state(self):
+        tmp_path = f"{self.state_path}.tmp"
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(self.last_seen, f)
+            os.replace(tmp_path, self.state_path)
+        except OSError as e:
+            logging.error("Failed to save daemon state to %s: %s", self.state_path, e)
+
+    def _load_bars(self):
+        """Refreshes bars for every symbol, in one batch when batch downloading is enabled."""
+        if PIPELINE_SETTINGS['batch_download']:
+            return self.bot.load_market_data(self.symbols)
+        market_data = {}
+        for symbol in self.symbols:
+            market_data[symbol] = {}
+            for timeframe in ("1D", "4H"):
+                df = self.bot.fetch_bars(symbol, timeframe)
+                if df is not None:
+                    market_data[symbol][timeframe] = df
+        return market_data
+
+    def due_symbols(self, market_data, timeframes):
+        """Symbols with a new or updated bar in any of `timeframes` since their last completed cycle."""
+        due = []
+        for symbol in self.symbols:
+            seen = self.last_seen.get(symbol, {})
+            bars = market_data.get(symbol, {})
+            if any(bar_fingerprint(bars.get(tf)) != seen.get(tf) for tf in timeframes):
+                due.append(symbol)
+        return due
+
+    def run_once(self, timeframes=("1D", "4H")):
+        """
+        Runs cycles for the symbols that have new bars in `timeframes`.
+
+        Returns:
+            list: The cycle results of the symbols that were run.
+        """
+        market_data = self._load_bars()
+        due = self.due_symbols(market_data, timeframes)
+        skipped = len(self.symbols) - len(due)
+        logging.info("Bar close for %s: %s symbols with new bars, %s unchanged.", '/'.join(timeframes), len(due), skipped)
+        telemetry.increment("daemon_symbols_skipped", skipped)
+        if not due:
+            return []
+
+        results = self.bot.run_cycles(due, {symbol: market_data.get(symbol, {}) for symbol in due})
+        for result in results:
+            # Aborted cycles are not recorded, so they are retried at the next wake.
+            if result['status'] == "COMPLETED":
+                bars = market_data.get(result['symbol'], {})
+                self.last_seen[result['symbol']] = {tf: bar_fingerprint(bars.get(tf)) for tf in ("1D", "4H")}
+        self._save_state()
+        logging.info("Lazy evaluation savings: %s", self.bot.summarize_skipped(results))
+        return results
+
+    def run_forever(self):
+        """Sleeps until each bar close and runs the due symbols until stop() is called."""
+        if DAEMON_SETTINGS['run_on_start']:
+            self._run_safely(("1D", "4H"))
+        while not self.stop_event.is_set():
+            now = pd.Timestamp.now(tz=self.schedule.timezone)
+            wake, timeframes = self.schedule.next_wake(now)
+            logging.info("Next bar close: %s at %s (%s).", '/'.join(timeframes), wake.isoformat(), self.schedule.timezone)
+            if self.stop_event.wait((wake - now).total_seconds()):
+                break
+            self._run_safely(timeframes)
+
+    def _run_safely(self, timeframes):
+        try:
+            self.run_once(timeframes)
+        except Exception as e:
+            logging.critical("Daemon cycle failed: %s", e, exc_info=True)
+        telemetry.flush()
+
+    def stop(self, *args):
+        logging.info("Daemon stop requested.")
+        self.stop_event.set()
+
+
+def run_daemon():
+    """Entry point for `python main.py --daemon`."""
+    bot_orchestrator = None
+    try:
+        logging.info("Starting Multi-Stock Trading Bot in daemon mode...")
+        bot_orchestrator = CentralOrchestrationModule()
+        trading_daemon = TradingDaemon(bot_orchestrator)
+        signal.signal(signal.SIGINT, trading_daemon.stop)
+        signal.signal(signal.SIGTERM, trading_daemon.stop)
+        trading_daemon.run_forever()
+    except Exception as e:
+        logging.critical("A critical error occurred in the daemon: %s", e, exc_info=True)
+    finally:
+        if bot_orchestrator is not None:
+            bot_orchestrator.close()
+        telemetry.flush()
+        logging.info("Daemon stopped.")
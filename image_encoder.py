@@ -0,0 +1,238 @@
+# /stock_bot/image_encoder.py
+
+import argparse
+import glob
+import io
+import logging
+import math
+import time
+from PIL import Image, ImageChops, ImageStat
+from config import IMAGE_ENCODING_SETTINGS
+import telemetry
+
+# Image token accounting of the chat-completions API: a low-detail image costs a flat
+# 85 tokens; a high-detail one is fitted into 2048x2048, scaled down until its short side
+# is at most 768 px, and then costs 85 tokens plus 170 per 512 px tile.
+LOW_DETAIL_TOKENS = 85
+TILE_TOKENS = 170
+TILE_SIZE = 512
+
+
+def estimate_image_tokens(width, height, detail="high"):
+    """Estimates the input tokens the VLM API bills for an image of width x height at `detail`."""
+    if detail == "low":
+        return LOW_DETAIL_TOKENS
+    scale = min(1.0, 2048 / max(width, height))
+    width, height = width * scale, height * scale
+    scale = min(1.0, 768 / min(width, height))
+    width, height = width * scale, height * scale
+    return LOW_DETAIL_TOKENS + TILE_TOKENS * math.ceil(width / TILE_SIZE) * math.ceil(height / TILE_SIZE)
+
+
+def _base64_size(num_bytes):
+    return 4 * math.ceil(num_bytes / 3)
+
+
+def _crop_margins(image):
+    """Crops the plain margin around the chart, taking the top-left pixel as the background colour."""
+    background = Image.new(image.mode, image.size, image.getpixel((0, 0)))
+    bbox = ImageChops.difference(image, background).getbbox()
+    return image.crop(bbox) if bbox else image
+
+
+def _shrink(image, settings):
+    scale = min(1.0, settings['max_width'] / image.width, settings['max_height'] / image.height)
+    if scale >= 1.0:
+        return image
+    return image.resize((max(1, round(image.width * scale)), max(1, round(image.height * scale))), Image.LANCZOS)
+
+
+def compact_chart(image_bytes, settings=None):
+    """
+    Re-encodes a rendered chart PNG into a smaller one for upload.
+
+    The plain margin is cropped, the chart is scaled down to fit max_width x max_height and
+    quantized to a palette of palette_colors colours without dithering, so the candles, lines
+    and labels keep their flat colours while the file shrinks several times.
+
+    Returns:
+        tuple: (PNG bytes, stats dict with the original and encoded byte, base64 and
+            estimated token sizes and the encoded width and height).
+    """
+    settings = settings or IMAGE_ENCODING_SETTINGS
+    image = Image.open(io.BytesIO(image_bytes))
+    original_size = image.size
+    image = image.convert("RGB")
+    if settings['crop_margins']:
+        image = _crop_margins(image)
+    image = _shrink(image, settings)
+    if settings['palette_colors']:
+        image = image.quantize(settings['palette_colors'], method=Image.Quantize.FASTOCTREE,
+                               dither=Image.Dither.NONE)
+    buffer = io.BytesIO()
+    image.save(buffer, format="PNG", optimize=settings['optimize'])
+    encoded = buffer.getvalue()
+
+    detail = settings['detail']
+    stats = {
+        "original_bytes": len(image_bytes), "encoded_bytes": len(encoded),
+        "original_base64_bytes": _base64_size(len(image_bytes)), "encoded_base64_bytes": _base64_size(len(encoded)),
+        # Charts are sent at "auto" (high) detail unless encoding says otherwise.
+        "original_tokens": estimate_image_tokens(*original_size),
+        "encoded_tokens": estimate_image_tokens(image.width, image.height, detail),
+        "width": image.width, "height": image.height,
+    }
+    stats["bytes_saved"] = stats["original_base64_bytes"] - stats["encoded_base64_bytes"]
+    stats["tokens_saved"] = stats["original_tokens"] - stats["encoded_tokens"]
+    return encoded, stats
+
+
+def encode_for_upload(image_bytes, settings=None):
+    """
+    Compacts a freshly rendered chart if encoding is enabled. Never raises, so it can run in
+    a render worker process; the caller reports the outcome with log_encoding.
+
+    Returns:
+        tuple: (PNG bytes to upload, stats from compact_chart plus 'encode_seconds' or None,
+            error message or None). On an error the chart is returned as rendered.
+    """
+    settings = settings or IMAGE_ENCODING_SETTINGS
+    if not settings['enabled']:
+        return image_bytes, None, None
+    start = time.perf_counter()
+    try:
+        encoded, stats = compact_chart(image_bytes, settings)
+    except Exception as e:
+        return image_bytes, None, str(e)
+    stats["encode_seconds"] = time.perf_counter() - start
+    return encoded, stats, None
+
+
+def log_encoding(symbol, stats, error):
+    """Logs the bytes and estimated tokens an encoded chart saves and adds them to telemetry."""
+    if error:
+        logging.warning("Could not compact chart for %s, sending it as rendered: %s", symbol, error)
+        telemetry.increment("failures", stage="encode")
+        return
+    if stats is None:
+        return
+    telemetry.observe("encode", stats['encode_seconds'])
+    logging.info("Chart for %s encoded for upload: %s -> %s bytes (%s base64 bytes saved), %sx%s, "
+                 "~%s -> ~%s image tokens.", symbol, stats['original_bytes'], stats['encoded_bytes'],
+                 stats['bytes_saved'], stats['width'], stats['height'],
+                 stats['original_tokens'], stats['encoded_tokens'])
+    telemetry.increment("image_bytes_saved", stats['bytes_saved'])
+    telemetry.increment("image_tokens_saved", stats['tokens_saved'])
+
+
+def cache_fingerprint(settings=None):
+    """The encoding settings that change what the VLM sees, for the analysis cache key."""
+    settings = settings or IMAGE_ENCODING_SETTINGS
+    if not settings['enabled']:
+        return {"enabled": False, "render_dpi": settings['render_dpi']}
+    return {key: settings[key] for key in ("enabled", "crop_margins", "max_width", "max_height",
+                                           "palette_colors", "detail", "render_dpi")}
+
+
+def pixel_error(original_bytes, encoded_bytes, settings=None):
+    """
+    Mean absolute grayscale difference (0-255) between a chart and its compact encoding.
+    The encoding is scaled back up onto the original's cropped area before comparing.
+    """
+    settings = settings or IMAGE_ENCODING_SETTINGS
+    original = Image.open(io.BytesIO(original_bytes)).convert("RGB")
+    if settings['crop_margins']:
+        original = _crop_margins(original)
+    encoded = Image.open(io.BytesIO(encoded_bytes)).convert("RGB").resize(original.size, Image.LANCZOS)
+    return ImageStat.Stat(ImageChops.difference(original.convert("L"), encoded.convert("L"))).mean[0]
+
+
+def _bias(analysis):
+    sentiment = str(analysis.get('technical_sentiment', {}).get('sentiment', '')).lower()
+    return 'bullish' if 'bullish' in sentiment else 'bearish' if 'bearish' in sentiment else 'neutral'
+
+
+def _levels(analysis, side):
+    levels = analysis.get('support_resistance', {}).get(side, [])
+    return [float(entry['level']) for entry in levels if isinstance(entry, dict) and entry.get('level') is not None]
+
+
+def compare_analyses(original, compacted, level_tolerance_pct):
+    """
+    Compares the VLM analyses of a chart and of its compact encoding.
+
+    Returns:
+        dict: 'same_bias' (both bullish, bearish or neutral) and 'level_match', the share of the
+            original support/resistance levels found within level_tolerance_pct in the other analysis.
+    """
+    matched = total = 0
+    for side in ('support', 'resistance'):
+        others = _levels(compacted, side)
+        for level in _levels(original, side):
+            total += 1
+            matched += any(abs(other - level) <= abs(level) * level_tolerance_pct / 100 for other in others)
+    return {"same_bias": _bias(original) == _bias(compacted),
+            "level_match": round(matched / total, 3) if total else 1.0}
+
+
+def check_quality(paths, settings=None, use_vlm=False):
+    """
+    Compacts recorded chart images and checks each encoding stays within the quality tolerance.
+
+    Every chart must stay within quality_check['max_pixel_error']. With `use_vlm`, each chart
+    is also analysed as rendered and as encoded for upload, and the two analyses must agree on
+    the sentiment bias and on at least quality_check['min_level_match'] of the S/R levels.
+
+    Returns:
+        tuple: (list of per-chart report dicts, True if every chart is within tolerance)
+    """
+    settings = settings or IMAGE_ENCODING_SETTINGS
+    tolerance = settings['quality_check']
+    baseline = compact = None
+    if use_vlm:
+        # Imported here: the offline check must not need an API key.
+        from vlm_analyzer import VLMTechnicalAnalyzer
+        # In-memory charts reach the analyzer already encoded, so `compact` only adds the detail level.
+        baseline = VLMTechnicalAnalyzer(image_settings={**settings, "enabled": False})
+        compact = VLMTechnicalAnalyzer(client=baseline.client, image_settings={**settings, "enabled": True})
+    reports = []
+    for path in paths:
+        with open(path, 'rb') as f:
+            original = f.read()
+        start = time.perf_counter()
+        encoded, stats = compact_chart(original, settings)
+        report = {"chart": path, **stats, "encode_ms": round((time.perf_counter() - start) * 1000, 1),
+                  "pixel_error": round(pixel_error(original, encoded, settings), 2)}
+        report["ok"] = report["pixel_error"] <= tolerance['max_pixel_error']
+        if use_vlm:
+            before, after = baseline.analyze_chart(original), compact.analyze_chart(encoded)
+            if before is None or after is None:
+                report.update(analysis=None, ok=False)
+            else:
+                report["analysis"] = compare_analyses(before, after, tolerance['level_tolerance_pct'])
+                report["ok"] = (report["ok"] and report["analysis"]["same_bias"]
+                                and report["analysis"]["level_match"] >= tolerance['min_level_match'])
+        reports.append(report)
+    if baseline is not None:
+        baseline.close()
+    return reports, all(report["ok"] for report in reports)
+
+
+if __name__ == "__main__":
+    from utils import setup_logging
+    parser = argparse.ArgumentParser(description="Compact recorded chart images and check their quality.")
+    parser.add_argument("charts", nargs="*", help="Chart PNGs to check (default: the *_chart.png files here).")
+    parser.add_argument("--vlm", action="store_true",
+                        help="Also compare VLM analyses of the original and compacted charts (uses the API).")
+    args = parser.parse_args()
+    setup_logging()
+    reports, passed = check_quality(args.charts or sorted(glob.glob("*_chart.png")), use_vlm=args.vlm)
+    for report in reports:
+        logging.info("%s: %s -> %s bytes (%s base64 bytes saved), %s -> %s tokens, %sx%s, "
+                     "pixel error %s, %s ms%s%s", report['chart'], report['original_bytes'],
+                     report['encoded_bytes'], report['bytes_saved'], report['original_tokens'],
+                     report['encoded_tokens'], report['width'], report['height'], report['pixel_error'],
+                     report['encode_ms'], f", analysis {report['analysis']}" if 'analysis' in report else "",
+                     "" if report['ok'] else " -- OUT OF TOLERANCE")
+    logging.info("Image encoding quality check %s on %s charts.", 'passed' if passed else 'FAILED', len(reports))
+    raise SystemExit(0 if passed else 1)
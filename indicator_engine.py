@@ -0,0 +1,200 @@
+# /stock_bot/indicator_engine.py
+
+import logging
+import time
+import numpy as np
+import pandas as pd
+from numpy.lib.stride_tricks import sliding_window_view
+
+
+def indicator_columns(indicator_settings):
+    """Returns the indicator column names produced for the given settings."""
+    return ([f'MA_{ma}' for ma in indicator_settings['moving_averages']] +
+            ['RSI', 'MACD', 'MACD_Signal', 'MACD_Hist', 'BB_Upper', 'BB_Lower'])
+
+
+# --- Batch mode: all symbols at once as 2D (symbols x bars) arrays ---
+
+def _rolling_windows(values, window):
+    """Returns sliding windows over the bar axis, or None if there are fewer bars than `window`."""
+    if values.shape[1] < window:
+        return None
+    return sliding_window_view(values, window, axis=1)
+
+def _rolling_mean(values, window):
+    out = np.full(values.shape, np.nan)
+    windows = _rolling_windows(values, window)
+    if windows is not None:
+        out[:, window - 1:] = windows.mean(axis=-1)
+    return out
+
+def _rolling_std(values, window):
+    out = np.full(values.shape, np.nan)
+    windows = _rolling_windows(values, window)
+    if windows is not None:
+        out[:, window - 1:] = windows.std(axis=-1, ddof=1)
+    return out
+
+def _ewm(values, span):
+    """Exponential moving average matching pandas' ewm(span=span, adjust=False)."""
+    alpha = 2.0 / (span + 1.0)
+    out = np.empty(values.shape)
+    out[:, 0] = values[:, 0]
+    for t in range(1, values.shape[1]):
+        out[:, t] = out[:, t - 1] + alpha * (values[:, t] - out[:, t - 1])
+    return out
+
+def compute_indicators(closes, indicator_settings):
+    """
+    Computes every indicator for many symbols at once.
+
+    Args:
+        closes (np.ndarray): 2D array of close prices, one row per symbol. Rows must be
+            aligned bar-for-bar and contain no gaps.
+        indicator_settings (dict): INDICATOR_SETTINGS_DAILY / INDICATOR_SETTINGS_HOURLY style dict.
+
+    Returns:
+        dict: Maps each indicator column name to a 2D array shaped like `closes`,
+            with NaN where the indicator has not warmed up yet.
+    """
+    closes = np.asarray(closes, dtype='float64')
+    if closes.ndim == 1:
+        closes = closes[np.newaxis, :]
+    results = {}
+    for ma in indicator_settings['moving_averages']:
+        results[f'MA_{ma}'] = _rolling_mean(closes, ma)
+
+    # The first bar has no change; like the pandas version it counts as zero gain and loss.
+    delta = np.zeros(closes.shape)
+    delta[:, 1:] = np.diff(closes, axis=1)
+    gain = _rolling_mean(np.where(delta > 0, delta, 0.0), indicator_settings['rsi_period'])
+    loss = _rolling_mean(np.where(delta < 0, -delta, 0.0), indicator_settings['rsi_period'])
+    with np.errstate(divide='ignore', invalid='ignore'):
+        results['RSI'] = 100 - (100 / (1 + gain / loss))
+
+    if closes.shape[1] == 0:
+        macd = signal = closes.copy()
+    else:
+        macd = _ewm(closes, indicator_settings['macd_fast']) - _ewm(closes, indicator_settings['macd_slow'])
+        signal = _ewm(macd, indicator_settings['macd_signal'])
+    results['MACD'] = macd
+    results['MACD_Signal'] = signal
+    results['MACD_Hist'] = macd - signal
+
+    ma_bb = _rolling_mean(closes, indicator_settings['bollinger_period'])
+    std_dev = _rolling_std(closes, indicator_settings['bollinger_period'])
+    results['BB_Upper'] = ma_bb + (std_dev * indicator_settings['bollinger_dev'])
+    results['BB_Lower'] = ma_bb - (std_dev * indicator_settings['bollinger_dev'])
+    return results
+
+def compute_indicators_ragged(series, indicator_settings):
+    """
+    compute_indicators for close histories of different lengths.
+
+    Every series is left-padded with its own first close so all of them fit one 2D batch.
+    The padding is flat, so the EMAs reach the first real bar exactly as they would on the
+    series alone; rolling values whose window reaches into the padding are reset to NaN,
+    which is the warm-up they would have had anyway.
+
+    Returns:
+        list: One dict of 1D indicator arrays per input series, in input order.
+    """
+    series = [np.asarray(s, dtype='float64') for s in series]
+    lengths = [len(s) for s in series]
+    width = max(lengths, default=0)
+    closes = np.empty((len(series), width))
+    for row, s in enumerate(series):
+        closes[row, :width - len(s)] = s[0] if len(s) else np.nan
+        closes[row, width - len(s):] = s
+    batch = compute_indicators(closes, indicator_settings) if len(series) else {}
+
+    warm_up = {f'MA_{ma}': ma - 1 for ma in indicator_settings['moving_averages']}
+    warm_up.update({'RSI': indicator_settings['rsi_period'] - 1,
+                    'BB_Upper': indicator_settings['bollinger_period'] - 1,
+                    'BB_Lower': indicator_settings['bollinger_period'] - 1})
+    results = []
+    for row, length in enumerate(lengths):
+        values = {}
+        for col, array in batch.items():
+            values[col] = array[row, width - length:].copy()
+            values[col][:warm_up.get(col, 0)] = np.nan
+        results.append(values)
+    return results
+
+
+# --- Equivalence check and benchmark ---
+
+def pandas_reference(df, indicator_settings):
+    """The original pandas rolling/ewm implementation, kept as the reference for check_equivalence."""
+    for ma in indicator_settings['moving_averages']:
+        df[f'MA_{ma}'] = df['Close'].rolling(window=ma).mean()
+    delta = df['Close'].diff()
+    gain = (delta.where(delta > 0, 0)).rolling(window=indicator_settings['rsi_period']).mean()
+    loss = (-delta.where(delta < 0, 0)).rolling(window=indicator_settings['rsi_period']).mean()
+    rs = gain / loss
+    df['RSI'] = 100 - (100 / (1 + rs))
+    exp1 = df['Close'].ewm(span=indicator_settings['macd_fast'], adjust=False).mean()
+    exp2 = df['Close'].ewm(span=indicator_settings['macd_slow'], adjust=False).mean()
+    df['MACD'] = exp1 - exp2
+    df['MACD_Signal'] = df['MACD'].ewm(span=indicator_settings['macd_signal'], adjust=False).mean()
+    df['MACD_Hist'] = df['MACD'] - df['MACD_Signal']
+    ma_bb = df['Close'].rolling(window=indicator_settings['bollinger_period']).mean()
+    std_dev = df['Close'].rolling(window=indicator_settings['bollinger_period']).std()
+    df['BB_Upper'] = ma_bb + (std_dev * indicator_settings['bollinger_dev'])
+    df['BB_Lower'] = ma_bb - (std_dev * indicator_settings['bollinger_dev'])
+    return df
+
+def _random_walk(num_symbols, num_bars, seed=0):
+    rng = np.random.default_rng(seed)
+    return 100 * np.exp(np.cumsum(rng.normal(0, 0.01, size=(num_symbols, num_bars)), axis=1))
+
+def check_equivalence(indicator_settings, num_symbols=5, num_bars=500, rtol=1e-9, atol=1e-9):
+    """
+    Verifies batch mode against the pandas reference on random-walk prices.
+
+    Raises:
+        AssertionError: If any indicator differs beyond the tolerance.
+    """
+    closes = _random_walk(num_symbols, num_bars)
+    batch = compute_indicators(closes, indicator_settings)
+    for row, symbol_closes in enumerate(closes):
+        reference = pandas_reference(pd.DataFrame({'Close': symbol_closes}), indicator_settings)
+        for column in indicator_columns(indicator_settings):
+            np.testing.assert_allclose(batch[column][row], reference[column].to_numpy(), rtol=rtol, atol=atol,
+                                       equal_nan=True, err_msg=f"batch {column} differs for series {row}")
+    logging.info("Indicator engine matches the pandas reference for settings %s.", indicator_settings)
+
+def benchmark(indicator_settings, num_symbols=500, num_bars=1000):
+    """
+    Times the pandas reference and batch mode on the same random-walk prices.
+
+    Returns:
+        dict: Seconds taken by each mode.
+    """
+    closes = _random_walk(num_symbols, num_bars)
+
+    start = time.perf_counter()
+    for symbol_closes in closes:
+        pandas_reference(pd.DataFrame({'Close': symbol_closes}), indicator_settings)
+    pandas_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    compute_indicators(closes, indicator_settings)
+    batch_seconds = time.perf_counter() - start
+
+    results = {
+        "symbols": num_symbols, "bars": num_bars,
+        "pandas_seconds": round(pandas_seconds, 4),
+        "batch_seconds": round(batch_seconds, 4),
+    }
+    logging.info("Indicator benchmark: %s", results)
+    return results
+
+
+if __name__ == "__main__":
+    from config import INDICATOR_SETTINGS_DAILY, INDICATOR_SETTINGS_HOURLY
+    from utils import setup_logging
+    setup_logging()
+    for settings in (INDICATOR_SETTINGS_DAILY, INDICATOR_SETTINGS_HOURLY):
+        check_equivalence(settings)
+        benchmark(settings)
@@ -1,9 +1,12 @@
 # /stock_bot/main.py
 
 import logging
+import sys
 from orchestrator import CentralOrchestrationModule
 from utils import setup_logging
-from config import TRADING_SYMBOLS
+import telemetry
+from screener import run_screener
+from config import TRADING_SYMBOLS, SCREENER_SETTINGS
 
 def main():
     """
@@ -11,19 +14,34 @@ def main():
     for a list of predefined stocks.
     """
     setup_logging()
+    bot_orchestrator = None
     
     try:
         logging.info("Starting Multi-Stock Trading Bot...")
         bot_orchestrator = CentralOrchestrationModule()
         
-        # Loop through each symbol and run the full analysis
-        for symbol in TRADING_SYMBOLS:
-            bot_orchestrator.run_analysis_cycle(symbol)
-            
+        # Optionally narrow a large universe down to the symbols worth a VLM analysis
+        symbols = run_screener() if SCREENER_SETTINGS['enabled'] else TRADING_SYMBOLS
+        results = bot_orchestrator.run_cycles(symbols)
+
+        logging.info("Lazy evaluation savings: %s", bot_orchestrator.summarize_skipped(results))
+        if telemetry.is_enabled():
+            logging.info("Stage latency summary: %s", telemetry.summary())
+        if bot_orchestrator.vlm_analyzer.cache is not None:
+            logging.info("VLM analysis cache stats: %s", bot_orchestrator.vlm_analyzer.cache.stats())
         logging.info("Multi-Stock Trading Bot run finished for all symbols.")
         
     except Exception as e:
-        logging.critical(f"A critical error occurred in the main execution block: {e}", exc_info=True)
+        logging.critical("A critical error occurred in the main execution block: %s", e, exc_info=True)
+    finally:
+        if bot_orchestrator is not None:
+            bot_orchestrator.close()
+        telemetry.flush()
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    if "--daemon" in sys.argv[1:]:
+        from daemon import run_daemon
+        setup_logging()
+        run_daemon()
+    else:
+        main()
\ No newline at end of file
@@ -1,95 +1,645 @@
 # /stock_bot/orchestrator.py
 
 import logging
+import threading
+import time
+import uuid
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
 # --- FIX: Import the new settings dictionaries ---
-from config import GENERIC_CHART_SETTINGS, INDICATOR_SETTINGS_DAILY, INDICATOR_SETTINGS_HOURLY
-from chart_generator import generate_chart_image
+from config import (GENERIC_CHART_SETTINGS, INDICATOR_SETTINGS_DAILY, INDICATOR_SETTINGS_HOURLY,
+                    PIPELINE_SETTINGS, CHART_OUTPUT_SETTINGS, RENDER_SERVICE_SETTINGS, BACKTEST_SETTINGS,
+                    VLM_BATCH_SETTINGS, RISK_SETTINGS, DAEMON_SETTINGS)
+from chart_generator import fetch_market_data, fetch_universe_data, render_chart
 # ... other imports are the same ...
 from vlm_analyzer import VLMTechnicalAnalyzer
 from news_analyzer import FundamentalAnalyzer
 from risk_manager import RiskManager
 from trade_executor import TradeExecutor
+from render_service import ChartRenderService
+from indicator_engine import compute_indicators
+from analysis_recorder import record_analysis
+from analysis_cache import completed_sessions
+import telemetry
+
+# Chart title suffix and indicator settings for each analysed timeframe.
+TIMEFRAMES = {
+    "1D": {"label": "Daily Chart", "indicator_settings": INDICATOR_SETTINGS_DAILY},
+    "4H": {"label": "4-Hour Chart", "indicator_settings": INDICATOR_SETTINGS_HOURLY},
+}
+
+# Guards the per-symbol work times that concurrent pipeline tasks record.
+_work_times_lock = threading.Lock()
 
 
 class CentralOrchestrationModule:
     # ... (init and _get_final_signal methods are the same) ...
     def __init__(self):
         logging.info("Initializing Central Orchestration Module...")
-        self.chart_gen = generate_chart_image
         self.vlm_analyzer = VLMTechnicalAnalyzer()
         self.fundamental_analyzer = FundamentalAnalyzer()
         self.risk_manager = RiskManager()
         self.trade_executor = TradeExecutor()
+        stage_limits = dict(PIPELINE_SETTINGS['stage_limits'])
+        self.render_service = None
+        if RENDER_SERVICE_SETTINGS['enabled'] and CHART_OUTPUT_SETTINGS['in_memory']:
+            self.render_service = ChartRenderService(RENDER_SERVICE_SETTINGS['workers'])
+            self.render_service.warm_up()
+            stage_limits['render'] = RENDER_SERVICE_SETTINGS['workers']
+        # One semaphore per pipeline stage caps how many calls of that stage run at once.
+        self.stage_limits = {
+            stage: threading.BoundedSemaphore(limit)
+            for stage, limit in stage_limits.items()
+        }
         logging.info("All agents initialized.")
 
+    def close(self):
+        """Waits for queued orders, then releases the chart render pool and HTTP connections."""
+        self.trade_executor.close()
+        if self.render_service is not None:
+            self.render_service.shutdown()
+        self.vlm_analyzer.close()
+
     def _get_final_signal(self, symbol, daily_analysis, hourly_analysis, fundamental_analysis):
         try:
             daily_sentiment = daily_analysis['technical_sentiment']['sentiment'].lower()
             hourly_sentiment = hourly_analysis['technical_sentiment']['sentiment'].lower()
             hourly_reasoning = hourly_analysis['technical_sentiment']['reasoning']
 
-            logging.info(f"[{symbol}] Daily Bias: '{daily_sentiment}'. 4H Signal: '{hourly_sentiment}'.")
+            logging.info("[%s] Daily Bias: '%s'. 4H Signal: '%s'.", symbol, daily_sentiment, hourly_sentiment)
 
             if 'bullish' in daily_sentiment and 'bullish' in hourly_sentiment:
                 return "BUY", f"Daily trend is bullish. 4H chart shows bullish confirmation. Reason: {hourly_reasoning}"
             elif 'bearish' in daily_sentiment and 'bearish' in hourly_sentiment:
                 return "SELL", f"Daily trend is bearish. 4H chart shows bearish confirmation. Reason: {hourly_reasoning}"
-            
+
             return "HOLD", "No clear alignment between Daily bias and 4H entry signal."
-        
+
         except (KeyError, TypeError) as e:
-            logging.error(f"[{symbol}] Error in decision logic due to missing analysis data: {e}")
+            logging.error("[%s] Error in decision logic due to missing analysis data: %s", symbol, e)
             return "HOLD", "Could not determine signal due to incomplete analysis."
 
-    def run_analysis_cycle(self, symbol):
-        """
-        Executes one full analysis cycle for a single stock symbol.
-        """
-        logging.info(f"========== STARTING ANALYSIS CYCLE FOR: {symbol} ==========")
-        
-        # --- FIX: Pass the correct indicator settings to the chart generator ---
-        chart_1d_settings = {
+    def _chart_settings(self, symbol, timeframe):
+        """Builds the chart generator arguments for one symbol and timeframe."""
+        return {
             "symbol": symbol,
-            "title": f"{symbol} Daily Chart",
-            "file_path": f"{symbol}_1D_chart.png",
-            "indicator_settings": INDICATOR_SETTINGS_DAILY, # Pass daily settings
-            **GENERIC_CHART_SETTINGS["1D"]
-        }
-        chart_4h_settings = {
-            "symbol": symbol,
-            "title": f"{symbol} 4-Hour Chart",
-            "file_path": f"{symbol}_4H_chart.png",
-            "indicator_settings": INDICATOR_SETTINGS_HOURLY, # Pass hourly settings
-            **GENERIC_CHART_SETTINGS["4H"]
+            "title": f"{symbol} {TIMEFRAMES[timeframe]['label']}",
+            "file_path": f"{symbol}_{timeframe}_chart.png",
+            "indicator_settings": TIMEFRAMES[timeframe]['indicator_settings'],
+            **GENERIC_CHART_SETTINGS[timeframe]
         }
 
-        # 2. Generate Chart Images and get data
-        chart_1d_path, df_1d = self.chart_gen(**chart_1d_settings)
-        chart_4h_path, df_4h = self.chart_gen(**chart_4h_settings)
+    def _cache_key(self, symbol, timeframe, df):
+        """Analysis cache key of a chart; a daily chart is keyed on its completed sessions only."""
+        settings = self._chart_settings(symbol, timeframe)
+        if timeframe == "1D":
+            df = completed_sessions(df, DAEMON_SETTINGS['exchange_timezone'], DAEMON_SETTINGS['session_close'])
+        return self.vlm_analyzer.cache_key(df, settings['indicator_settings'], settings['title'])
+
+    def load_market_data(self, symbols):
+        """
+        Batch-loads bars for all symbols when batch downloading is enabled.
+
+        Returns:
+            dict: {symbol: {timeframe: DataFrame}}, or an empty dict if batching is off.
+        """
+        if not PIPELINE_SETTINGS['batch_download']:
+            return {}
+        with self.stage_limits['fetch']:
+            return fetch_universe_data(symbols, {tf: GENERIC_CHART_SETTINGS[tf] for tf in TIMEFRAMES})
+
+    def fetch_bars(self, symbol, timeframe, df=None):
+        """Returns bars for one timeframe, fetching them under the fetch stage limit unless preloaded."""
+        if df is None:
+            settings = self._chart_settings(symbol, timeframe)
+            with self.stage_limits['fetch']:
+                df = fetch_market_data(symbol, settings['resolution'], settings['num_points'])
+        if df is None or df.empty:
+            logging.error("No data fetched for %s, cannot generate chart.", symbol)
+            return None
+        return df
+
+    def _render(self, symbol, timeframe, df):
+        """Renders the chart for one timeframe under the render stage limit."""
+        settings = self._chart_settings(symbol, timeframe)
+        with self.stage_limits['render'], telemetry.labels(timeframe=timeframe):
+            in_memory = CHART_OUTPUT_SETTINGS['in_memory']
+            file_path = settings['file_path'] if not in_memory or CHART_OUTPUT_SETTINGS['save_to_disk'] else None
+            if self.render_service is not None:
+                return self.render_service.render(df, symbol, settings['resolution'], settings['title'],
+                                                  file_path, settings['indicator_settings'])
+            return render_chart(df, symbol, settings['resolution'], settings['title'],
+                                file_path, settings['indicator_settings'], as_bytes=in_memory)
+
+    def _build_chart(self, symbol, timeframe, df=None):
+        """
+        Fetches data and renders the chart for one timeframe, each step under its stage limit.
+        Data is only fetched when no preloaded `df` is given.
+
+        Returns:
+            tuple: (chart, dataframe), with None in place of anything that failed. The chart is
+                PNG bytes in in-memory mode, otherwise the path of the saved image.
+        """
+        df = self.fetch_bars(symbol, timeframe, df)
+        if df is None:
+            return None, None
+        return self._render(symbol, timeframe, df), df
+
+    def _analyze_chart(self, symbol, timeframe, chart, df):
+        """Returns the VLM analysis of a chart, from the analysis cache when the chart is unchanged."""
+        cache_key = self._cache_key(symbol, timeframe, df)
+        # Cache hits skip the VLM stage limit so they never queue behind slow API calls.
+        analysis = self.vlm_analyzer.get_cached_analysis(cache_key)
+        if analysis is None:
+            with self.stage_limits['vlm'], telemetry.labels(timeframe=timeframe):
+                analysis = self.vlm_analyzer.analyze_chart(chart, cache_key=cache_key)
+        self._record_analysis(symbol, timeframe, df, analysis)
+        return analysis
+
+    def _analyze_batch(self, charts, cycle_ids=None):
+        """
+        Returns the VLM analyses of several charts, answering unchanged charts from the cache
+        and sending the rest in one batched request.
+
+        Args:
+            charts (dict): Maps (symbol, timeframe) to (chart, dataframe).
+            cycle_ids (dict): Optional {symbol: cycle_id}. The shared request is labelled with
+                all the symbols and cycle ids it covers; single-chart fallbacks with their own.
+
+        Returns:
+            dict: Maps (symbol, timeframe) to the analysis, or None where it failed.
+        """
+        analyses, misses = {}, []
+        for (symbol, timeframe), (chart, df) in charts.items():
+            cache_key = self._cache_key(symbol, timeframe, df)
+            analysis = self.vlm_analyzer.get_cached_analysis(cache_key)
+            if analysis is None:
+                misses.append((symbol, timeframe, chart, cache_key))
+            else:
+                analyses[(symbol, timeframe)] = analysis
+        if misses:
+            symbols = list(dict.fromkeys(symbol for symbol, _, _, _ in misses))
+            symbol_labels = {symbol: self._symbol_labels(symbol, cycle_ids) for symbol in symbols}
+            shared_labels = {name: ",".join(str(symbol_labels[symbol].get(name, "")) for symbol in symbols)
+                             for name in set().union(*symbol_labels.values())}
+            with self.stage_limits['vlm'], telemetry.labels(**shared_labels):
+                analyses.update(self.vlm_analyzer.analyze_charts(misses, symbol_labels=symbol_labels))
+        for (symbol, timeframe), analysis in analyses.items():
+            self._record_analysis(symbol, timeframe, charts[(symbol, timeframe)][1], analysis)
+        return analyses
+
+    @staticmethod
+    def _symbol_labels(symbol, cycle_ids):
+        """Telemetry labels for one symbol's stages inside a multi-symbol task."""
+        labels = {"symbol": symbol}
+        if cycle_ids and cycle_ids.get(symbol) is not None:
+            labels["cycle_id"] = cycle_ids[symbol]
+        return labels
+
+    @staticmethod
+    def _record_analysis(symbol, timeframe, df, analysis):
+        if analysis is not None and BACKTEST_SETTINGS['record_analyses']:
+            record_analysis(BACKTEST_SETTINGS['recording_path'], symbol, timeframe, df.index[-1], analysis)
+
+    def _execute_trade(self, trade_params):
+        """Queues the order and returns its Future; decisions never wait for the broker."""
+        return self.trade_executor.execute_trade(trade_params)
+
+    def _run_timeframe(self, symbol, timeframe, df=None):
+        """Builds and analyses a single timeframe chart. Used by the concurrent pipeline."""
+        chart, df = self._build_chart(symbol, timeframe, df)
+        analysis = self._analyze_chart(symbol, timeframe, chart, df) if chart else None
+        return chart, df, analysis
+
+    @staticmethod
+    def _evaluation(analysis_1d=None, analysis_4h=None, df_4h=None, error=None, hold_reason=None, skipped_stages=None):
+        """
+        Bundles the outcome of a symbol's chart/VLM stages for _complete_cycle.
+        Exactly one of `error` (abort), `hold_reason` (decided early) or both analyses is set.
+        """
+        return {"analysis_1d": analysis_1d, "analysis_4h": analysis_4h, "df_4h": df_4h,
+                "error": error, "hold_reason": hold_reason, "skipped_stages": skipped_stages or []}
+
+    def _evaluate_full(self, symbol, market_data):
+        """Renders and analyses both timeframes before any decision is made."""
+        chart_1d, df_1d = self._build_chart(symbol, "1D", market_data.get("1D"))
+        chart_4h, df_4h = self._build_chart(symbol, "4H", market_data.get("4H"))
 
-        if not chart_1d_path or not chart_4h_path or df_4h is None:
-            logging.error(f"[{symbol}] Failed to generate charts or fetch data. Aborting cycle for this symbol.")
-            return
+        if not chart_1d or not chart_4h or df_4h is None:
+            return self._evaluation(error="Failed to generate charts or fetch data.")
+
+        analysis_1d = self._analyze_chart(symbol, "1D", chart_1d, df_1d)
+        analysis_4h = self._analyze_chart(symbol, "4H", chart_4h, df_4h)
 
-        # ... (The rest of the method is the same) ...
-        analysis_1d = self.vlm_analyzer.analyze_chart(chart_1d_path)
-        analysis_4h = self.vlm_analyzer.analyze_chart(chart_4h_path)
-        
         if not analysis_1d or not analysis_4h:
-            logging.error(f"[{symbol}] Failed to get VLM analysis. Aborting cycle for this symbol.")
-            return
+            return self._evaluation(error="Failed to get VLM analysis.")
+        return self._evaluation(analysis_1d, analysis_4h, df_4h)
+
+    def _daily_precheck(self, df_1d):
+        """
+        Cheap numeric screen of the daily bars. Returns a reason string when RSI sits in the
+        neutral band and price hugs the trend MA, i.e. the daily VLM bias is very likely neutral.
+        """
+        settings = PIPELINE_SETTINGS['daily_precheck']
+        if not settings['enabled']:
+            return None
+        # The trend MA need not be one of the charted daily MAs, so it is computed on its own.
+        indicator_settings = {**INDICATOR_SETTINGS_DAILY, "moving_averages": [settings['trend_ma']]}
+        indicators = compute_indicators(df_1d['Close'].to_numpy(dtype='float64'), indicator_settings)
+        rsi = indicators['RSI'][0, -1]
+        trend_ma = indicators[f"MA_{settings['trend_ma']}"][0, -1]
+        if np.isnan(rsi) or np.isnan(trend_ma):
+            return None
+        distance_pct = abs(df_1d['Close'].iloc[-1] / trend_ma - 1) * 100
+        low, high = settings['rsi_neutral_band']
+        if low <= rsi <= high and distance_pct <= settings['max_ma_distance_pct']:
+            return (f"Daily pre-check is neutral (RSI {rsi:.1f}, price {distance_pct:.2f}% from "
+                    f"MA_{settings['trend_ma']}). No trade possible without a directional daily bias.")
+        return None
+
+    @staticmethod
+    def _skipped_4h_stages(market_data):
+        """The 4H stages a lazy evaluation avoids when it stops after the daily chart."""
+        return ([] if market_data.get("4H") is not None else ["4H_fetch"]) + ["4H_render", "4H_vlm"]
+
+    @staticmethod
+    def _daily_hold_reason(symbol, analysis_1d):
+        """Returns why the cycle must end in HOLD given the daily analysis, or None if it has a direction."""
+        try:
+            daily_sentiment = analysis_1d['technical_sentiment']['sentiment'].lower()
+        except (KeyError, TypeError, AttributeError) as e:
+            logging.error("[%s] Error in decision logic due to missing analysis data: %s", symbol, e)
+            return "Could not determine signal due to incomplete analysis."
+        if 'bullish' not in daily_sentiment and 'bearish' not in daily_sentiment:
+            logging.info("[%s] Daily Bias: '%s'. Skipping 4H stages.", symbol, daily_sentiment)
+            return f"Daily bias '{daily_sentiment}' has no direction; 4H confirmation not needed."
+        return None
+
+    def _evaluate_lazy(self, symbol, market_data):
+        """
+        Staged evaluation that stops as soon as the outcome is known to be HOLD.
+
+        _get_final_signal needs 'bullish' or 'bearish' in the daily sentiment to trade, so the
+        daily chart is analysed first and the 4H stages are skipped when it is neither. The
+        optional numeric pre-check can skip the daily render and VLM call as well.
+        """
+        skipped_4h = self._skipped_4h_stages(market_data)
+        df_1d = self.fetch_bars(symbol, "1D", market_data.get("1D"))
+        if df_1d is None:
+            return self._evaluation(error="Failed to generate charts or fetch data.")
+
+        precheck_reason = self._daily_precheck(df_1d)
+        if precheck_reason:
+            return self._evaluation(hold_reason=precheck_reason, skipped_stages=["1D_render", "1D_vlm"] + skipped_4h)
 
+        chart_1d = self._render(symbol, "1D", df_1d)
+        if not chart_1d:
+            return self._evaluation(error="Failed to generate charts or fetch data.")
+        analysis_1d = self._analyze_chart(symbol, "1D", chart_1d, df_1d)
+        if not analysis_1d:
+            return self._evaluation(error="Failed to get VLM analysis.")
+
+        hold_reason = self._daily_hold_reason(symbol, analysis_1d)
+        if hold_reason:
+            return self._evaluation(hold_reason=hold_reason, skipped_stages=skipped_4h)
+
+        chart_4h, df_4h = self._build_chart(symbol, "4H", market_data.get("4H"))
+        if not chart_4h or df_4h is None:
+            return self._evaluation(error="Failed to generate charts or fetch data.")
+        analysis_4h = self._analyze_chart(symbol, "4H", chart_4h, df_4h)
+        if not analysis_4h:
+            return self._evaluation(error="Failed to get VLM analysis.")
+        return self._evaluation(analysis_1d, analysis_4h, df_4h)
+
+    def _evaluate_batch(self, symbols, market_data, cycle_ids=None):
+        """
+        Evaluates a group of symbols like _evaluate_full/_evaluate_lazy, but analyses the charts
+        of each stage in one batched VLM request (see VLM_BATCH_SETTINGS): all charts at once,
+        or with lazy evaluation the daily charts first and then the 4H charts still needed.
+
+        Args:
+            market_data (dict): {symbol: {timeframe: DataFrame}} of preloaded bars.
+            cycle_ids (dict): Optional {symbol: cycle_id}; each symbol's stages run under its
+                symbol and cycle_id labels.
+
+        Returns:
+            dict: The evaluation of each symbol.
+        """
+        lazy = PIPELINE_SETTINGS['lazy_evaluation']
+        first_stage = ("1D",) if lazy else tuple(TIMEFRAMES)
+        evaluations, charts = {}, {}
+        for symbol in symbols:
+            with telemetry.labels(**self._symbol_labels(symbol, cycle_ids)):
+                preloaded = market_data.get(symbol, {})
+                try:
+                    if lazy:
+                        df_1d = self.fetch_bars(symbol, "1D", preloaded.get("1D"))
+                        precheck_reason = self._daily_precheck(df_1d) if df_1d is not None else None
+                        if precheck_reason:
+                            evaluations[symbol] = self._evaluation(hold_reason=precheck_reason,
+                                                                   skipped_stages=["1D_render", "1D_vlm"] + self._skipped_4h_stages(preloaded))
+                            continue
+                        built = {"1D": (self._render(symbol, "1D", df_1d) if df_1d is not None else None, df_1d)}
+                    else:
+                        built = {tf: self._build_chart(symbol, tf, preloaded.get(tf)) for tf in TIMEFRAMES}
+                except Exception as e:
+                    evaluations[symbol] = self._worker_failure(symbol, e)
+                    continue
+                if not all(chart for chart, _ in built.values()):
+                    evaluations[symbol] = self._evaluation(error="Failed to generate charts or fetch data.")
+                    continue
+                for timeframe, chart_and_df in built.items():
+                    charts[(symbol, timeframe)] = chart_and_df
+        analyses = self._analyze_batch(charts, cycle_ids)
+
+        second_stage = {}
+        for symbol in symbols:
+            if symbol in evaluations:
+                continue
+            with telemetry.labels(**self._symbol_labels(symbol, cycle_ids)):
+                if not all(analyses.get((symbol, tf)) for tf in first_stage):
+                    evaluations[symbol] = self._evaluation(error="Failed to get VLM analysis.")
+                elif not lazy:
+                    evaluations[symbol] = self._evaluation(analyses[(symbol, "1D")], analyses[(symbol, "4H")],
+                                                           charts[(symbol, "4H")][1])
+                else:
+                    preloaded = market_data.get(symbol, {})
+                    hold_reason = self._daily_hold_reason(symbol, analyses[(symbol, "1D")])
+                    if hold_reason:
+                        evaluations[symbol] = self._evaluation(hold_reason=hold_reason,
+                                                               skipped_stages=self._skipped_4h_stages(preloaded))
+                        continue
+                    try:
+                        chart_4h, df_4h = self._build_chart(symbol, "4H", preloaded.get("4H"))
+                    except Exception as e:
+                        evaluations[symbol] = self._worker_failure(symbol, e)
+                        continue
+                    if not chart_4h or df_4h is None:
+                        evaluations[symbol] = self._evaluation(error="Failed to generate charts or fetch data.")
+                        continue
+                    second_stage[(symbol, "4H")] = (chart_4h, df_4h)
+
+        if second_stage:
+            analyses.update(self._analyze_batch(second_stage, cycle_ids))
+        for (symbol, _), (_, df_4h) in second_stage.items():
+            analysis_4h = analyses.get((symbol, "4H"))
+            evaluations[symbol] = (self._evaluation(analyses[(symbol, "1D")], analysis_4h, df_4h) if analysis_4h
+                                   else self._evaluation(error="Failed to get VLM analysis."))
+        return evaluations
+
+    def _worker_failure(self, symbol, error):
+        """Logs an exception raised while evaluating `symbol` and returns its aborting evaluation."""
+        logging.error("Evaluation of %s raised an exception", symbol,
+                      exc_info=(type(error), error, error.__traceback__))
+        telemetry.increment("failures", stage="evaluate")
+        return self._evaluation(error=f"Evaluation failed: {error}")
+
+    def _evaluate(self, symbol, market_data):
+        if VLM_BATCH_SETTINGS['enabled']:
+            cycle_ids = {symbol: telemetry.current_labels().get('cycle_id')}
+            return self._evaluate_batch([symbol], {symbol: market_data}, cycle_ids)[symbol]
+        if PIPELINE_SETTINGS['lazy_evaluation']:
+            return self._evaluate_lazy(symbol, market_data)
+        return self._evaluate_full(symbol, market_data)
+
+    def _complete_cycle(self, symbol, evaluation):
+        """Turns a symbol's evaluation into its cycle result: abort, early HOLD or full decision."""
+        if evaluation['skipped_stages']:
+            logging.info("[%s] Skipped stages: %s", symbol, ', '.join(evaluation['skipped_stages']))
+        if evaluation['error']:
+            result = self._aborted(symbol, evaluation['error'])
+        elif evaluation['hold_reason']:
+            logging.info("[%s] FINAL DECISION: HOLD. REASON: %s", symbol, evaluation['hold_reason'])
+            logging.info("========== ANALYSIS CYCLE FOR %s COMPLETE ==========\n", symbol)
+            result = {"symbol": symbol, "status": "COMPLETED", "signal": "HOLD",
+                      "reasoning": evaluation['hold_reason'], "trade_params": None}
+        else:
+            result = self._finish_cycle(symbol, evaluation['analysis_1d'], evaluation['analysis_4h'],
+                                        evaluation['df_4h'])
+        result['skipped_stages'] = evaluation['skipped_stages']
+        return result
+
+    def _finish_cycle(self, symbol, analysis_1d, analysis_4h, df_4h):
+        """
+        Turns the two chart analyses into a decision. A BUY/SELL decision is kept as the
+        result's 'candidate' until place_trades() sizes and queues the trades of the run.
+
+        Returns:
+            dict: The cycle result for this symbol.
+        """
         fundamental_data = self.fundamental_analyzer.get_analysis()
         final_signal, reasoning = self._get_final_signal(symbol, analysis_1d, analysis_4h, fundamental_data)
-        logging.info(f"[{symbol}] FINAL DECISION: {final_signal}. REASON: {reasoning}")
+        logging.info("[%s] FINAL DECISION: %s. REASON: %s", symbol, final_signal, reasoning)
 
+        candidate = None
         if final_signal in ["BUY", "SELL"]:
             latest_close_price = df_4h['Close'].iloc[-1]
-            logging.info(f"[{symbol}] Latest 4H close price for risk calculation: {latest_close_price:.2f}")
-            trade_params = self.risk_manager.calculate_trade_parameters(final_signal, latest_close_price, analysis_4h)
-            if trade_params:
-                trade_params['symbol'] = symbol
-                self.trade_executor.execute_trade(trade_params)
-            else:
-                logging.warning(f"[{symbol}] Trade signal generated but risk parameters could not be calculated. No trade placed.")
-        logging.info(f"========== ANALYSIS CYCLE FOR {symbol} COMPLETE ==========\n")
\ No newline at end of file
+            logging.info("[%s] Latest 4H close price for risk calculation: %.2f", symbol, latest_close_price)
+            candidate = {"symbol": symbol, "signal": final_signal, "entry_price": latest_close_price,
+                         "analysis": analysis_4h}
+        logging.info("========== ANALYSIS CYCLE FOR %s COMPLETE ==========\n", symbol)
+        return {"symbol": symbol, "status": "COMPLETED", "signal": final_signal,
+                "reasoning": reasoning, "trade_params": None, "candidate": candidate}
+
+    def place_trades(self, results):
+        """
+        Sizes the BUY/SELL signals of a run together (RiskManager.size_portfolio, with the
+        portfolio caps unless RISK_SETTINGS['portfolio_caps'] is off, counting the positions
+        the broker reports as held) and queues the trades.
+
+        Fills in each traded result's 'trade_params' and 'order' (the Future of the order's
+        confirmation) and records why a signal was not traded in 'risk_rejection'.
+        """
+        candidates = {}
+        for index, result in enumerate(results):
+            result.setdefault('order', None)
+            candidate = result.pop('candidate', None)
+            if candidate:
+                candidates[index] = candidate
+        if not candidates:
+            return results
+        pending = [results[index] for index in candidates]
+        apply_caps = RISK_SETTINGS['portfolio_caps']
+        trades, reasons = self.risk_manager.size_portfolio(
+            list(candidates.values()), apply_caps=apply_caps,
+            open_positions=self.trade_executor.open_positions() if apply_caps else None)
+        for result, trade_params, reason in zip(pending, trades, reasons):
+            symbol = result['symbol']
+            with telemetry.labels(symbol=symbol, cycle_id=result.get('cycle_id')):
+                if trade_params:
+                    trade_params['symbol'] = symbol
+                    result['trade_params'] = trade_params
+                    result['order'] = self._execute_trade(trade_params)
+                else:
+                    logging.warning("[%s] Trade signal generated but no trade placed: %s.", symbol, reason)
+                    result['risk_rejection'] = reason
+        return results
+
+    def _aborted(self, symbol, reason):
+        logging.error("[%s] %s Aborting cycle for this symbol.", symbol, reason)
+        telemetry.increment("failures", stage="cycle")
+        return {"symbol": symbol, "status": "ABORTED", "signal": None,
+                "reasoning": reason, "trade_params": None}
+
+    @staticmethod
+    def summarize_skipped(results):
+        """Counts the VLM calls and chart renders that lazy evaluation avoided across cycle results."""
+        stages = [stage for result in results for stage in result.get('skipped_stages', [])]
+        return {
+            "vlm_calls_skipped": sum(stage.endswith("_vlm") for stage in stages),
+            "renders_skipped": sum(stage.endswith("_render") for stage in stages),
+            "fetches_skipped": sum(stage.endswith("_fetch") for stage in stages),
+        }
+
+    @staticmethod
+    def _new_cycle_id():
+        """Short random id that tags a symbol's cycle in log records and telemetry spans."""
+        return uuid.uuid4().hex[:12]
+
+    def run_analysis_cycle(self, symbol, market_data=None, place_trades=True):
+        """
+        Executes one full analysis cycle for a single stock symbol.
+
+        Args:
+            market_data (dict): Optional preloaded {timeframe: DataFrame} for this symbol,
+                as returned per symbol by load_market_data.
+            place_trades (bool): Size and queue the trade right away. Pass False to leave a
+                BUY/SELL signal in result['candidate'] for a place_trades() call over the run.
+
+        Returns:
+            dict: The cycle result with the symbol, status, signal, reasoning, trade parameters
+                and the pipeline stages skipped by lazy evaluation.
+        """
+        cycle_id = self._new_cycle_id()
+        with telemetry.labels(symbol=symbol, cycle_id=cycle_id), telemetry.span("cycle"):
+            logging.info("========== STARTING ANALYSIS CYCLE FOR: %s ==========", symbol)
+            evaluation = self._evaluate(symbol, market_data or {})
+            result = self._complete_cycle(symbol, evaluation)
+        result['cycle_id'] = cycle_id
+        if place_trades:
+            self.place_trades([result])
+        return result
+
+    def run_cycles(self, symbols, market_data=None):
+        """
+        Runs one analysis cycle for every symbol, concurrently or one by one per PIPELINE_SETTINGS.
+        `market_data` optionally supplies bars already loaded with load_market_data.
+        """
+        if PIPELINE_SETTINGS['concurrent']:
+            # Overlap fetch/render/VLM work across all symbols and timeframes
+            return self.run_concurrent_cycles(symbols, market_data)
+        # Loop through each symbol and run the full analysis
+        if market_data is None:
+            market_data = self.load_market_data(symbols)
+        results = [self.run_analysis_cycle(symbol, market_data.get(symbol), place_trades=False)
+                   for symbol in symbols]
+        # Size all signals of the run together so the portfolio caps apply across symbols
+        return self.place_trades(results)
+
+    def run_concurrent_cycles(self, symbols, market_data=None):
+        """
+        Runs the analysis cycle for many symbols with their I/O-bound stages overlapped.
+
+        Bars are batch-loaded first (see load_market_data). With lazy evaluation each symbol's
+        staged evaluation runs as one task; otherwise every (symbol, timeframe) chain of
+        fetch -> render -> VLM is submitted separately. Either way work is throttled by the
+        per-stage limits in PIPELINE_SETTINGS. With VLM_BATCH_SETTINGS enabled each group of
+        symbols_per_request symbols runs as one task whose charts share VLM requests.
+        Decisions are made in the order of `symbols`, so each symbol gets the same decision
+        as in a serial run and decision/trade logs appear in a stable order. Once all decisions are made, the run's trades are sized
+        together by place_trades() and go to the TradeExecutor's order queue.
+
+        Args:
+            market_data (dict): Optional bars already loaded by load_market_data; loaded here if omitted.
+
+        Returns:
+            list: One cycle result per symbol, in the order given.
+        """
+        symbols = list(symbols)
+        if not symbols:
+            return []
+        results = []
+        if market_data is None:
+            market_data = self.load_market_data(symbols)
+        lazy = PIPELINE_SETTINGS['lazy_evaluation']
+        limits = PIPELINE_SETTINGS['stage_limits']
+        group_size = VLM_BATCH_SETTINGS['symbols_per_request'] if VLM_BATCH_SETTINGS['enabled'] else None
+        # Enough workers to keep every fetch, render and VLM slot busy, but no more.
+        if group_size:
+            tasks = -(-len(symbols) // group_size)
+        else:
+            tasks = len(symbols) if lazy else len(symbols) * len(TIMEFRAMES)
+        chain_workers = min(tasks, limits['fetch'] + limits['render'] + limits['vlm'])
+        with ThreadPoolExecutor(max_workers=chain_workers, thread_name_prefix="chart") as chart_pool:
+            pending = {}
+            cycle_ids = {symbol: self._new_cycle_id() for symbol in symbols}
+            work_times = {}
+            for index, symbol in enumerate(symbols):
+                labels = {"symbol": symbol, "cycle_id": cycle_ids[symbol]}
+                with telemetry.labels(**labels):
+                    logging.info("========== STARTING ANALYSIS CYCLE FOR: %s ==========", symbol)
+                preloaded = market_data.get(symbol, {})
+                if group_size:
+                    if index % group_size == 0:
+                        group = symbols[index:index + group_size]
+                        future = chart_pool.submit(self._timed(self._evaluate_batch, group, work_times), group,
+                                                   {member: market_data.get(member, {}) for member in group},
+                                                   {member: cycle_ids[member] for member in group})
+                        pending.update({member: future for member in group})
+                elif lazy:
+                    pending[symbol] = chart_pool.submit(self._timed(telemetry.bind(self._evaluate_lazy, **labels),
+                                                                    [symbol], work_times), symbol, preloaded)
+                else:
+                    pending[symbol] = {tf: chart_pool.submit(self._timed(telemetry.bind(self._run_timeframe, **labels),
+                                                                         [symbol], work_times),
+                                                             symbol, tf, preloaded.get(tf))
+                                       for tf in TIMEFRAMES}
+
+            for symbol in symbols:
+                try:
+                    if group_size:
+                        evaluation = pending[symbol].result()[symbol]
+                    elif lazy:
+                        evaluation = pending[symbol].result()
+                    else:
+                        evaluation = self._collect_timeframes(pending[symbol])
+                except Exception as e:
+                    # A worker that raised only aborts its own symbols; the rest of the run carries on.
+                    evaluation = self._worker_failure(symbol, e)
+                with telemetry.labels(symbol=symbol, cycle_id=cycle_ids[symbol]):
+                    decide_start = time.perf_counter()
+                    results.append({**self._complete_cycle(symbol, evaluation), "cycle_id": cycle_ids[symbol]})
+                    # As in a serial run, cycle time is this symbol's own work: from its first task starting
+                    # to its last one finishing, plus its decision; time spent queued or waiting is left out.
+                    first, last = work_times.get(symbol, (decide_start, decide_start))
+                    telemetry.observe("cycle", last - first + time.perf_counter() - decide_start)
+        return self.place_trades(results)
+
+    @staticmethod
+    def _timed(func, symbols, work_times):
+        """
+        Wraps a pipeline task so it records, per symbol in `symbols`, when the first of the symbol's
+        tasks started and the last one finished into `work_times` as {symbol: (start, end)}.
+        """
+        def run(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                end = time.perf_counter()
+                with _work_times_lock:
+                    for symbol in symbols:
+                        first, last = work_times.get(symbol, (start, end))
+                        work_times[symbol] = (min(first, start), max(last, end))
+        return run
+
+    def _collect_timeframes(self, futures):
+        """Builds an evaluation from the per-timeframe futures of the non-lazy concurrent pipeline."""
+        chart_1d, _, analysis_1d = futures["1D"].result()
+        chart_4h, df_4h, analysis_4h = futures["4H"].result()
+
+        if not chart_1d or not chart_4h or df_4h is None:
+            return self._evaluation(error="Failed to generate charts or fetch data.")
+        if not analysis_1d or not analysis_4h:
+            return self._evaluation(error="Failed to get VLM analysis.")
+        return self._evaluation(analysis_1d, analysis_4h, df_4h)
@@ -0,0 +1,157 @@
+# /stock_bot/render_service.py
+
+import io
+import logging
+import multiprocessing
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import pandas as pd
+from chart_generator import plot_chart, prepare_chart_data, save_chart_bytes
+from image_encoder import encode_for_upload, log_encoding
+from config import IMAGE_ENCODING_SETTINGS
+import telemetry
+
+# Per-worker state, created once by _init_worker and reused for every job.
+_worker_style = None
+
+# Workers are started from a clean interpreter rather than forked: the bot forks them while its
+# chart, VLM and order threads may hold locks, which a forked child would inherit held.
+START_METHOD = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+
+
+def _init_worker():
+    """Pre-imports the plotting stack in a worker process and builds the chart style once."""
+    global _worker_style
+    import matplotlib
+    matplotlib.use('Agg')
+    import mplfinance as mpf
+    _worker_style = mpf.make_mpf_style(base_mpf_style='yahoo')
+
+
+def _warm_up_job():
+    # Holds the worker briefly so concurrent warm-up jobs land on different processes.
+    time.sleep(0.05)
+
+
+def _peak_rss_job():
+    import resource
+    time.sleep(0.05)
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def _pack(df_with_indicators):
+    """Flattens a chart frame into plain NumPy arrays, which pickle much faster than a DataFrame."""
+    return {
+        "index": df_with_indicators.index.values.astype('datetime64[ns]').astype('int64'),
+        "columns": {col: df_with_indicators[col].to_numpy() for col in df_with_indicators.columns},
+    }
+
+
+def _render_job(payload, title, indicator_settings, image_settings):
+    """
+    Worker entry point: rebuilds the chart frame, renders it and compacts it for upload.
+
+    Returns:
+        tuple: (PNG bytes as rendered, PNG bytes to upload, encoding stats, encoding error);
+            see image_encoder.encode_for_upload.
+    """
+    index = pd.DatetimeIndex(payload["index"].astype('datetime64[ns]'))
+    df_with_indicators = pd.DataFrame(payload["columns"], index=index)
+    buffer = io.BytesIO()
+    plot_chart(df_with_indicators, title, indicator_settings, buffer, style=_worker_style)
+    rendered = buffer.getvalue()
+    return (rendered, *encode_for_upload(rendered, image_settings))
+
+
+class ChartRenderService:
+    """
+    Pool of warm worker processes that render charts to PNG bytes.
+
+    matplotlib holds the GIL and is not thread-safe, so rendering scales with processes
+    rather than threads. Workers import matplotlib/mplfinance and build the chart style
+    once at start-up. Indicators are computed in the calling process and shipped to the
+    workers as NumPy arrays together with the bars. Workers also compact each chart for
+    upload (IMAGE_ENCODING_SETTINGS), so the VLM stage only sends it. If a worker dies,
+    the broken pool is replaced and the chart is rendered once more on the new one.
+    """
+    def __init__(self, workers):
+        self.workers = workers
+        self._pool_lock = threading.Lock()
+        self._pool = self._new_pool()
+        logging.info("ChartRenderService started with %s worker processes.", workers)
+
+    def _new_pool(self):
+        return ProcessPoolExecutor(max_workers=self.workers, initializer=_init_worker,
+                                   mp_context=multiprocessing.get_context(START_METHOD))
+
+    def _replace_pool(self, broken):
+        """Swaps a broken pool for a new one, unless another thread already did."""
+        with self._pool_lock:
+            if self._pool is broken:
+                logging.warning("Render pool broke (a worker process died); starting a new one.")
+                telemetry.increment("failures", stage="render_pool")
+                broken.shutdown(wait=False, cancel_futures=True)
+                self._pool = self._new_pool()
+
+    def warm_up(self):
+        """Starts every worker process now so the first charts don't pay the import cost."""
+        for future in [self._pool.submit(_warm_up_job) for _ in range(self.workers)]:
+            future.result()
+
+    def worker_peak_rss(self):
+        """
+        Peak resident memory of each worker in ru_maxrss units (Unix only). Workers are not
+        children of this process, so RUSAGE_CHILDREN does not cover them.
+        """
+        return [future.result() for future in [self._pool.submit(_peak_rss_job) for _ in range(self.workers)]]
+
+    def submit(self, df, symbol, title, indicator_settings):
+        """
+        Queues a chart for rendering.
+
+        Returns:
+            Future: Resolves to the (rendered, upload, stats, error) tuple of _render_job, or
+                None if there was nothing to plot.
+        """
+        df_with_indicators = prepare_chart_data(df, symbol, indicator_settings)
+        if df_with_indicators is None:
+            future = Future()
+            future.set_result(None)
+            return future
+        return self._pool.submit(_render_job, _pack(df_with_indicators), title, indicator_settings,
+                                 IMAGE_ENCODING_SETTINGS)
+
+    def render(self, df, symbol, resolution, title, file_path, indicator_settings):
+        """
+        Renders a chart on a worker and waits for the result. Mirrors render_chart(as_bytes=True).
+
+        Returns:
+            bytes: The PNG image to upload, or None if rendering failed.
+        """
+        try:
+            logging.info("Creating chart for %s (%s resolution) in render pool...", symbol, resolution)
+            with telemetry.span("render", symbol=symbol):
+                pool = self._pool
+                try:
+                    rendered = self.submit(df, symbol, title, indicator_settings).result()
+                except BrokenProcessPool:
+                    self._replace_pool(pool)
+                    rendered = self.submit(df, symbol, title, indicator_settings).result()
+            if rendered is None:
+                return None
+            image_bytes, upload_bytes, stats, error = rendered
+            if file_path:
+                save_chart_bytes(image_bytes, file_path)
+            logging.info("Chart for %s rendered in memory (%s bytes).", symbol, len(image_bytes))
+            log_encoding(symbol, stats, error)
+            return upload_bytes
+        except Exception as e:
+            logging.error("Failed to generate chart image for %s: %s", symbol, e, exc_info=True)
+            telemetry.increment("failures", stage="render")
+            return None
+
+    def shutdown(self):
+        self._pool.shutdown(wait=True)
+
@@ -1,6 +1,122 @@
 # /stock_bot/risk_manager.py
 import logging
-from config import RISK_SETTINGS
+import numpy as np
+from config import RISK_SETTINGS, SYMBOL_SECTORS
+import telemetry
+
+
+def sort_levels(level_lists):
+    """Packs per-signal lists of price levels into an (n, k) array, each row sorted ascending and NaN-padded."""
+    width = max((len(levels) for levels in level_lists), default=0)
+    packed = np.full((len(level_lists), max(width, 1)), np.nan)
+    for row, levels in enumerate(level_lists):
+        packed[row, :len(levels)] = levels
+    # NaN sorts last, so padding stays at the end of every row.
+    return np.sort(packed, axis=1)
+
+
+def searchsorted_rows(sorted_rows, values, side='left'):
+    """
+    np.searchsorted for every row of `sorted_rows` against its own value, as a binary search
+    run on all rows at once (log2(k) vectorized steps). NaN padding counts as +inf.
+    """
+    n, k = sorted_rows.shape
+    rows = np.arange(n)
+    lo = np.zeros(n, dtype=np.intp)
+    hi = np.full(n, k, dtype=np.intp)
+    while True:
+        active = lo < hi
+        if not active.any():
+            return lo
+        mid = (lo + hi) // 2
+        pivot = sorted_rows[rows, np.minimum(mid, k - 1)]
+        go_right = active & (pivot < values if side == 'left' else pivot <= values)
+        lo = np.where(go_right, mid + 1, lo)
+        hi = np.where(active & ~go_right, mid, hi)
+
+
+def size_positions(is_buy, entry, sorted_supports, sorted_resistances, risk_settings):
+    """
+    Vectorized RiskManager sizing for many signals.
+
+    The stop is the nearest support strictly below entry for buys and the nearest resistance
+    strictly above entry for sells; levels must be sorted per row (see sort_levels).
+
+    Returns:
+        tuple: (stop, target, shares, valid) arrays; invalid rows have NaN stops and 0 shares.
+    """
+    n = len(entry)
+    rows = np.arange(n)
+    below = searchsorted_rows(sorted_supports, entry, side='left') - 1
+    above = searchsorted_rows(sorted_resistances, entry, side='right')
+    nearest_support = np.where(below >= 0, sorted_supports[rows, np.maximum(below, 0)], np.nan)
+    in_range = above < sorted_resistances.shape[1]
+    nearest_resistance = np.where(in_range, sorted_resistances[rows, np.minimum(above, sorted_resistances.shape[1] - 1)], np.nan)
+
+    stop = np.where(is_buy, nearest_support, nearest_resistance)
+    risk_per_share = np.abs(entry - stop)
+    valid = ~np.isnan(stop) & (risk_per_share > 0)
+    direction = np.where(is_buy, 1.0, -1.0)
+    target = entry + direction * risk_per_share * risk_settings['min_reward_to_risk']
+    risk_amount = risk_settings['account_equity'] * (risk_settings['risk_per_trade_percent'] / 100)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        shares = np.where(valid, risk_amount / risk_per_share, 0.0)
+    return stop, target, shares, valid
+
+
+def apply_portfolio_caps(risk_usd, exposure_usd, sectors, risk_settings, open_positions=()):
+    """
+    Admits positions in the given (priority) order, each reduced to what still fits under the
+    account-level caps.
+
+    Limits, from RISK_SETTINGS: a single position's notional may not exceed the account equity,
+    'max_sector_exposure_percent' of equity per sector (notional), 'max_total_risk_percent' of
+    equity across all positions, and 'max_open_positions'. Positions that are already open count
+    against the caps first; after them, only admitted (and reduced) sizes count, so a rejected
+    position never blocks a later one.
+
+    Args:
+        open_positions: (risk_usd, exposure_usd, sector) of every position already held.
+
+    Returns:
+        tuple: (scale, reasons) arrays. scale is the fraction of each requested position that
+            is admitted: 1.0 in full, 0.0 when rejected. reasons says which limit reduced or
+            rejected a position, and is None for positions admitted in full.
+    """
+    equity = risk_settings['account_equity']
+    # Tolerance so caps that are an exact multiple of the per-trade risk are not missed by rounding.
+    tolerance = 1e-9 * equity
+    sector_cap = equity * risk_settings['max_sector_exposure_percent'] / 100
+    risk_cap = equity * risk_settings['max_total_risk_percent'] / 100
+    scale = np.zeros(len(risk_usd))
+    reasons = np.full(len(risk_usd), None, dtype=object)
+
+    sector_exposure, total_risk, admitted = {}, 0.0, 0
+    for risk, exposure, sector in open_positions:
+        sector_exposure[str(sector)] = sector_exposure.get(str(sector), 0.0) + exposure
+        total_risk += risk
+        admitted += 1
+    for i, (risk, exposure, sector) in enumerate(zip(np.asarray(risk_usd, dtype='float64').tolist(),
+                                                     np.asarray(exposure_usd, dtype='float64').tolist(),
+                                                     (str(sector) for sector in sectors))):
+        if admitted >= risk_settings['max_open_positions']:
+            reasons[i] = f"limit of {risk_settings['max_open_positions']} open positions reached"
+            continue
+        fraction = 1.0
+        for amount, room, reason in (
+                (exposure, equity, "notional exceeds the account equity"),
+                (exposure, sector_cap - sector_exposure.get(sector, 0.0),
+                 f"sector exposure cap of {risk_settings['max_sector_exposure_percent']}% of equity"),
+                (risk, risk_cap - total_risk, f"total risk cap of {risk_settings['max_total_risk_percent']}% of equity")):
+            if amount > room + tolerance and max(room, 0.0) / amount < fraction:
+                fraction, reasons[i] = max(room, 0.0) / amount, reason
+        scale[i] = fraction
+        if fraction > 0:
+            sector_exposure[sector] = sector_exposure.get(sector, 0.0) + exposure * fraction
+            total_risk += risk * fraction
+            admitted += 1
+    return scale, reasons
+
 
 class RiskManager:
     # ... (init is the same) ...
@@ -9,50 +125,102 @@ class RiskManager:
         logging.info("RiskManager initialized.")
 
     def calculate_trade_parameters(self, signal, latest_price, technical_analysis):
-        try:
-            entry_price = latest_price
-            stop_loss_price = None
-
-            if signal == "BUY":
-                supports = sorted([s['level'] for s in technical_analysis['support_resistance']['support'] if s['level'] < entry_price], reverse=True)
-                if not supports:
-                    logging.warning(f"BUY signal but no valid support level found below current price {entry_price}. Cannot set SL.")
-                    return None
-                stop_loss_price = supports[0]
-            elif signal == "SELL":
-                resistances = sorted([r['level'] for r in technical_analysis['support_resistance']['resistance'] if r['level'] > entry_price])
-                if not resistances:
-                    logging.warning(f"SELL signal but no valid resistance level found above current price {entry_price}. Cannot set SL.")
-                    return None
-                stop_loss_price = resistances[0]
-            else:
-                return None
-            
-            risk_per_share = abs(entry_price - stop_loss_price)
-            if risk_per_share <= 0:
-                logging.warning("Invalid risk distance (<= 0) calculated. Cannot place trade.")
-                return None
-
-            if signal == "BUY":
-                take_profit_price = entry_price + (risk_per_share * self.settings['min_reward_to_risk'])
-            else:
-                take_profit_price = entry_price - (risk_per_share * self.settings['min_reward_to_risk'])
-
-            risk_amount_per_trade = self.settings['account_equity'] * (self.settings['risk_per_trade_percent'] / 100)
-            
-            # --- STOCK-SPECIFIC CALCULATION ---
-            num_shares_to_trade = risk_amount_per_trade / risk_per_share
-            
-            trade_params = {
-                "signal": signal,
-                "entry_price": round(entry_price, 2),
-                "stop_loss": round(stop_loss_price, 2),
-                "take_profit": round(take_profit_price, 2),
-                "position_size_shares": round(num_shares_to_trade, 2), # Now in shares
-                "risk_per_trade_usd": round(risk_amount_per_trade, 2)
-            }
-            logging.info(f"Calculated trade parameters: {trade_params}")
-            return trade_params
-        except (KeyError, IndexError, TypeError) as e:
-            logging.error(f"Could not calculate trade parameters. VLM output might be malformed or missing S/R levels. Error: {e}", exc_info=True)
-            return None
\ No newline at end of file
+        """Sizes a single trade without portfolio caps. Returns the trade parameters or None."""
+        if signal not in ("BUY", "SELL"):
+            return None
+        trades, _ = self.size_portfolio([{"symbol": None, "signal": signal, "entry_price": latest_price,
+                                          "analysis": technical_analysis}], apply_caps=False)
+        return trades[0]
+
+    def size_portfolio(self, candidates, apply_caps=True, open_positions=None):
+        """
+        Sizes all BUY/SELL signals of a run in one NumPy pass and applies the portfolio caps.
+
+        Args:
+            candidates (list): Dicts with 'symbol', 'signal', 'entry_price' and the 4H
+                'analysis' whose support/resistance levels set the stop. Earlier candidates
+                take priority when a cap is reached; a signal that only partly fits is
+                traded with a reduced size.
+            apply_caps (bool): Whether to apply the account-level caps in RISK_SETTINGS.
+            open_positions (list): Trade parameters ('symbol', 'entry_price',
+                'position_size_shares', 'risk_per_trade_usd') of positions already held,
+                which count against the caps first.
+
+        Returns:
+            tuple: (trades, reasons), aligned with `candidates`. trades holds the trade
+                parameters of each accepted signal or None; reasons says why a signal was
+                not traded, or is None.
+        """
+        if not candidates:
+            return [], []
+        with telemetry.span("risk"):
+            trades = [None] * len(candidates)
+            reasons = [None] * len(candidates)
+            supports, resistances, usable = [], [], []
+            for i, candidate in enumerate(candidates):
+                try:
+                    levels = candidate['analysis']['support_resistance']
+                    support_levels = [float(s['level']) for s in levels['support']]
+                    resistance_levels = [float(r['level']) for r in levels['resistance']]
+                    if candidate['signal'] not in ("BUY", "SELL"):
+                        raise ValueError(f"unexpected signal {candidate['signal']!r}")
+                except (KeyError, IndexError, TypeError, ValueError) as e:
+                    logging.error("Could not calculate trade parameters. VLM output might be malformed or missing S/R levels. Error: %s", e, exc_info=True)
+                    telemetry.increment("failures", stage="risk")
+                    reasons[i] = "malformed analysis"
+                    continue
+                supports.append(support_levels)
+                resistances.append(resistance_levels)
+                usable.append(i)
+            if not usable:
+                return trades, reasons
+
+            signal = np.array([candidates[i]['signal'] for i in usable])
+            is_buy = signal == "BUY"
+            entry = np.array([candidates[i]['entry_price'] for i in usable], dtype='float64')
+            stop, target, shares, valid = size_positions(is_buy, entry, sort_levels(supports),
+                                                         sort_levels(resistances), self.settings)
+            risk_amount = self.settings['account_equity'] * (self.settings['risk_per_trade_percent'] / 100)
+            for position in np.flatnonzero(~valid):
+                reason = ("no valid support level below the entry price" if is_buy[position]
+                          else "no valid resistance level above the entry price")
+                logging.warning("%s signal for %s but %s %s. Cannot set SL.", signal[position],
+                                candidates[usable[position]].get('symbol') or 'N/A', reason, entry[position])
+                reasons[usable[position]] = reason
+
+            accepted = valid.copy()
+            risk_usd = np.full(len(usable), risk_amount)
+            if apply_caps:
+                sized = np.flatnonzero(valid)
+                sectors = [SYMBOL_SECTORS.get(candidates[usable[p]].get('symbol'), "Unknown") for p in sized]
+                held = [(position['risk_per_trade_usd'], position['position_size_shares'] * position['entry_price'],
+                         SYMBOL_SECTORS.get(position.get('symbol'), "Unknown")) for position in open_positions or []]
+                scale, cap_reasons = apply_portfolio_caps(risk_usd[sized], shares[sized] * entry[sized], sectors,
+                                                          self.settings, open_positions=held)
+                shares[sized] *= scale
+                risk_usd[sized] *= scale
+                accepted[sized[scale == 0]] = False
+                for p, fraction, reason in zip(sized, scale, cap_reasons):
+                    symbol = candidates[usable[p]].get('symbol') or 'N/A'
+                    if fraction == 0:
+                        logging.warning("%s signal for %s not traded: %s reached.", signal[p], symbol, reason)
+                        reasons[usable[p]] = f"{reason} reached"
+                    elif reason:
+                        logging.info("%s position for %s reduced to %.0f%% of its size: %s.",
+                                     signal[p], symbol, fraction * 100, reason)
+
+            positions = np.flatnonzero(accepted)
+            # Round whole columns at once and convert them to Python floats for the order dicts.
+            columns = [np.round(values[positions], 2).tolist() for values in (entry, stop, target, shares, risk_usd)]
+            for position, entry_price, stop_loss, take_profit, num_shares, risk_usd_rounded in zip(positions, *columns):
+                trade_params = {
+                    "signal": str(signal[position]),
+                    "entry_price": entry_price,
+                    "stop_loss": stop_loss,
+                    "take_profit": take_profit,
+                    "position_size_shares": num_shares, # Now in shares
+                    "risk_per_trade_usd": risk_usd_rounded
+                }
+                logging.info("Calculated trade parameters: %s", trade_params)
+                trades[usable[position]] = trade_params
+            return trades, reasons
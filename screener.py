@@ -0,0 +1,169 @@
+# /stock_bot/screener.py
+
+import json
+import logging
+import os
+import time
+import numpy as np
+from config import SCREENER_SETTINGS, INDICATOR_SETTINGS_DAILY, TRADING_SYMBOLS
+from chart_generator import fetch_universe_data
+from indicator_engine import compute_indicators
+import telemetry
+
+
+def load_universe(path=None):
+    """Reads the symbols to screen, one per line ('#' starts a comment). Falls back to TRADING_SYMBOLS."""
+    path = path or SCREENER_SETTINGS['universe_file']
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            symbols = [line.split('#')[0].strip().upper() for line in f]
+    except OSError:
+        logging.warning("Universe file %s not found; screening TRADING_SYMBOLS instead.", path)
+        return list(TRADING_SYMBOLS)
+    # Keep the file order but drop blanks and duplicates.
+    return list(dict.fromkeys(symbol for symbol in symbols if symbol))
+
+
+def compute_features(closes, settings):
+    """
+    Screening features at the latest bar of every row of a (symbols x bars) close matrix.
+
+    Returns:
+        dict: 1D arrays, one value per symbol: 'direction' (+1 uptrend, -1 downtrend, 0 none),
+            'rsi', 'macd_cross' (+1/-1 for a bullish/bearish signal-line cross within the
+            lookback, else 0) and 'squeeze' (Bollinger bandwidth at or below its lookback percentile).
+    """
+    rules = settings['rules']
+    trend, squeeze_rule = rules['trend'], rules['bollinger_squeeze']
+    indicator_settings = {**INDICATOR_SETTINGS_DAILY,
+                          "moving_averages": sorted({trend['fast_ma'], trend['slow_ma']})}
+    indicators = compute_indicators(closes, indicator_settings)
+    close = closes[:, -1]
+    fast, slow = indicators[f"MA_{trend['fast_ma']}"][:, -1], indicators[f"MA_{trend['slow_ma']}"][:, -1]
+    direction = np.where((close > fast) & (fast > slow), 1, np.where((close < fast) & (fast < slow), -1, 0))
+
+    # A cross is a sign change of the MACD histogram between consecutive bars; the latest one wins.
+    hist = indicators['MACD_Hist'][:, -(rules['macd_cross']['lookback_bars'] + 1):]
+    crosses = np.sign(hist[:, 1:]) * (np.sign(hist[:, 1:]) != np.sign(hist[:, :-1]))
+    has_cross = crosses != 0
+    last_cross = hist.shape[1] - 2 - np.argmax(has_cross[:, ::-1], axis=1)
+    macd_cross = np.where(has_cross.any(axis=1), crosses[np.arange(len(close)), last_cross], 0)
+
+    middle = indicators['BB_Upper'] / 2 + indicators['BB_Lower'] / 2
+    with np.errstate(divide='ignore', invalid='ignore'):
+        bandwidth = (indicators['BB_Upper'] - indicators['BB_Lower']) / middle
+    recent = bandwidth[:, -squeeze_rule['lookback_bars']:]
+    threshold = np.nanpercentile(recent, squeeze_rule['percentile'], axis=1)
+    squeeze = recent[:, -1] <= threshold
+
+    return {"direction": direction, "rsi": indicators['RSI'][:, -1],
+            "macd_cross": macd_cross.astype(int), "squeeze": squeeze}
+
+
+def score_features(features, settings):
+    """
+    Weighted rule score per symbol. A trend earns its weight; RSI momentum in the trend's
+    direction earns up to its weight but nothing once it is overbought/oversold; a MACD cross
+    in the trend's direction and a Bollinger squeeze earn theirs.
+    """
+    rules = settings['rules']
+    direction = features['direction']
+    rsi_rule = rules['rsi']
+    with np.errstate(invalid='ignore'):
+        momentum = np.clip(direction * (features['rsi'] - 50) / (rsi_rule['overbought'] - 50), 0, 1)
+        exhausted = ((direction > 0) & (features['rsi'] >= rsi_rule['overbought'])) | \
+                    ((direction < 0) & (features['rsi'] <= rsi_rule['oversold']))
+    momentum = np.where(exhausted | np.isnan(momentum), 0.0, momentum)
+    return (rules['trend']['weight'] * np.abs(direction)
+            + rsi_rule['weight'] * momentum
+            + rules['macd_cross']['weight'] * ((features['macd_cross'] != 0) & (features['macd_cross'] == direction))
+            + rules['bollinger_squeeze']['weight'] * features['squeeze'])
+
+
+def _describe(features, index):
+    direction = {1: "uptrend", -1: "downtrend", 0: "no trend"}[int(features['direction'][index])]
+    cross = {1: "bullish MACD cross", -1: "bearish MACD cross", 0: "no MACD cross"}[int(features['macd_cross'][index])]
+    squeeze = "Bollinger squeeze" if features['squeeze'][index] else "no squeeze"
+    return f"{direction}, RSI {features['rsi'][index]:.1f}, {cross}, {squeeze}"
+
+
+def screen(daily_bars, settings=None):
+    """
+    Ranks symbols by their rule score on daily bars and keeps the top K.
+
+    Args:
+        daily_bars (dict): {symbol: daily DataFrame}, in priority order for ties.
+        settings (dict): SCREENER_SETTINGS-style dict; defaults to SCREENER_SETTINGS.
+
+    Returns:
+        dict: 'selected' (symbols in rank order), 'scores' ({symbol: score} of every
+            screened symbol) and 'pruned' (list of {"symbol", "score", "reason"}).
+    """
+    settings = settings or SCREENER_SETTINGS
+    min_bars = settings['min_bars']
+    pruned, scores = [], {}
+    screened, closes = [], []
+    for symbol, df in daily_bars.items():
+        if df is None or df.empty:
+            pruned.append({"symbol": symbol, "score": None, "reason": "no daily data"})
+        elif len(df) < min_bars:
+            pruned.append({"symbol": symbol, "score": None, "reason": f"only {len(df)} daily bars (needs {min_bars})"})
+        else:
+            screened.append(symbol)
+            closes.append(df['Close'].to_numpy(dtype='float64'))
+    if not screened:
+        return {"selected": [], "scores": scores, "pruned": pruned}
+
+    # Every screened symbol has at least min_bars bars, so their tails stack into one matrix.
+    features = compute_features(np.stack([close[-min_bars:] for close in closes]), settings)
+    score = np.round(score_features(features, settings), 4)
+    scores.update(zip(screened, score.tolist()))
+
+    eligible = np.flatnonzero(score >= settings['min_score'])
+    ranked = eligible[np.argsort(-score[eligible], kind='stable')]
+    selected = ranked[:settings['top_k']]
+    for index in np.flatnonzero(score < settings['min_score']):
+        pruned.append({"symbol": screened[index], "score": float(score[index]),
+                       "reason": f"score below {settings['min_score']} ({_describe(features, index)})"})
+    for rank, index in enumerate(ranked[settings['top_k']:], start=settings['top_k'] + 1):
+        pruned.append({"symbol": screened[index], "score": float(score[index]),
+                       "reason": f"ranked {rank} of {len(ranked)}, outside the top {settings['top_k']} ({_describe(features, index)})"})
+    return {"selected": [screened[index] for index in selected], "scores": scores, "pruned": pruned}
+
+
+def run_screener(universe=None, settings=None):
+    """
+    Loads daily bars for the whole universe in one batch, screens them and writes the report.
+
+    Returns:
+        list: The symbols to pass to the chart + VLM pipeline, best first.
+    """
+    settings = settings or SCREENER_SETTINGS
+    universe = list(universe or load_universe(settings['universe_file']))
+    logging.info("Screening %s symbols for the top %s...", len(universe), settings['top_k'])
+    start = time.perf_counter()
+    market_data = fetch_universe_data(universe, {"1D": {"resolution": "D", "num_points": settings['min_bars']}})
+    loaded = time.perf_counter()
+    with telemetry.span("screen", symbols=len(universe)):
+        result = screen({symbol: market_data.get(symbol, {}).get("1D") for symbol in universe}, settings)
+    finished = time.perf_counter()
+
+    logging.info("Screener selected %s of %s symbols in %.2fs (bars loaded in %.2fs): %s",
+                 len(result['selected']), len(universe), finished - loaded, loaded - start,
+                 ', '.join(result['selected']))
+    if not result['selected']:
+        logging.warning("Screener selected no symbols out of %s; no analysis cycles will run.", len(universe))
+    for entry in result['pruned'][:settings['log_pruned']]:
+        logging.info("Screener pruned %s: %s.", entry['symbol'], entry['reason'])
+    telemetry.increment("screener_pruned", len(result['pruned']))
+
+    report = {"at": time.time(), "universe": len(universe), "screen_seconds": round(finished - loaded, 4),
+              "load_seconds": round(loaded - start, 4), **result}
+    try:
+        tmp_path = f"{settings['report_path']}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+        os.replace(tmp_path, settings['report_path'])
+    except OSError as e:
+        logging.error("Failed to write screener report to %s: %s", settings['report_path'], e)
+    return result['selected']
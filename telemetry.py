@@ -0,0 +1,240 @@
+# /stock_bot/telemetry.py
+
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from config import TELEMETRY_SETTINGS
+
+METRIC_PREFIX = "stock_bot"
+
+
+class MetricsRegistry:
+    """
+    Thread-safe store of stage latency histograms, counters and not-yet-exported span records.
+
+    Histograms use fixed upper bounds (`buckets`, in seconds) like Prometheus histograms, so
+    memory stays constant however long the bot runs.
+    """
+    def __init__(self, buckets):
+        self.buckets = tuple(sorted(buckets))
+        self.histograms = {}
+        self.counters = {}
+        self.pending = []
+        self._lock = threading.Lock()
+
+    def observe(self, stage, seconds, record=None):
+        with self._lock:
+            histogram = self.histograms.get(stage)
+            if histogram is None:
+                histogram = self.histograms[stage] = {"counts": [0] * (len(self.buckets) + 1), "sum": 0.0, "count": 0,
+                                                      "min": seconds, "max": seconds}
+            position = next((i for i, bound in enumerate(self.buckets) if seconds <= bound), len(self.buckets))
+            histogram["counts"][position] += 1
+            histogram["sum"] += seconds
+            histogram["count"] += 1
+            histogram["min"] = min(histogram["min"], seconds)
+            histogram["max"] = max(histogram["max"], seconds)
+            if record is not None:
+                self.pending.append(record)
+
+    def increment(self, name, amount, labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + amount
+
+    def quantile(self, stage, q):
+        """
+        Estimates a latency quantile from the histogram, interpolating inside the bucket and
+        clamping to the observed min/max so sparse buckets don't distort fast stages.
+        """
+        with self._lock:
+            histogram = self.histograms.get(stage)
+            if not histogram or not histogram["count"]:
+                return None
+            rank = q * histogram["count"]
+            cumulative, lower, estimate = 0, 0.0, histogram["max"]
+            for bound, count in zip(self.buckets, histogram["counts"]):
+                if count and cumulative + count >= rank:
+                    estimate = lower + (bound - lower) * (rank - cumulative) / count
+                    break
+                cumulative += count
+                lower = bound
+            return min(max(estimate, histogram["min"]), histogram["max"])
+
+    def summary(self):
+        """Count, mean and estimated p50/p95 latency per stage, in seconds."""
+        with self._lock:
+            stages = {stage: (h["count"], h["sum"]) for stage, h in self.histograms.items()}
+        return {stage: {"count": count,
+                        "mean_seconds": round(total / count, 4) if count else None,
+                        "p50_seconds": _round(self.quantile(stage, 0.5)),
+                        "p95_seconds": _round(self.quantile(stage, 0.95))}
+                for stage, (count, total) in stages.items()}
+
+    def counter_values(self):
+        with self._lock:
+            return [{"name": name, "labels": dict(labels), "value": value}
+                    for (name, labels), value in sorted(self.counters.items())]
+
+    def drain(self):
+        with self._lock:
+            records, self.pending = self.pending, []
+        return records
+
+    def prometheus_text(self):
+        """Renders all metrics in the Prometheus text exposition format."""
+        name = f"{METRIC_PREFIX}_stage_duration_seconds"
+        lines = [f"# HELP {name} Wall-clock time spent in each pipeline stage.", f"# TYPE {name} histogram"]
+        with self._lock:
+            for stage, histogram in sorted(self.histograms.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets + (float('inf'),), histogram["counts"]):
+                    cumulative += count
+                    le = "+Inf" if bound == float('inf') else repr(float(bound))
+                    lines.append(f'{name}_bucket{{stage="{stage}",le="{le}"}} {cumulative}')
+                lines.append(f'{name}_sum{{stage="{stage}"}} {histogram["sum"]}')
+                lines.append(f'{name}_count{{stage="{stage}"}} {histogram["count"]}')
+            counters = sorted(self.counters.items())
+        declared = set()
+        for (counter, labels), value in counters:
+            metric = f"{METRIC_PREFIX}_{counter}_total"
+            if metric not in declared:
+                lines.append(f"# TYPE {metric} counter")
+                declared.add(metric)
+            label_text = ",".join(f'{key}="{val}"' for key, val in labels)
+            lines.append(f"{metric}{{{label_text}}} {value}" if label_text else f"{metric} {value}")
+        return "\n".join(lines) + "\n"
+
+
+def _round(value):
+    return None if value is None else round(value, 4)
+
+
+_registry = MetricsRegistry(TELEMETRY_SETTINGS['histogram_buckets_seconds'])
+_enabled = TELEMETRY_SETTINGS['enabled']
+_context = threading.local()
+
+
+def enable(flag=True):
+    """Turns recording on or off at runtime (it starts as TELEMETRY_SETTINGS['enabled'])."""
+    global _enabled
+    _enabled = flag
+
+def is_enabled():
+    return _enabled
+
+def registry():
+    return _registry
+
+
+# --- Labels: symbol/timeframe of the work running on the current thread ---
+
+def current_labels():
+    return getattr(_context, "labels", {})
+
+@contextmanager
+def labels(**new_labels):
+    """Tags spans recorded on this thread inside the block, e.g. labels(symbol="AAPL")."""
+    previous = current_labels()
+    _context.labels = {**previous, **new_labels}
+    try:
+        yield
+    finally:
+        _context.labels = previous
+
+def bind(func, **new_labels):
+    """Wraps `func` so it runs under `new_labels`; used for work handed to thread pools."""
+    def bound(*args, **kwargs):
+        with labels(**new_labels):
+            return func(*args, **kwargs)
+    return bound
+
+
+# --- Recording ---
+
+class _Span:
+    __slots__ = ("stage", "labels", "started_at", "start")
+
+    def __init__(self, stage, span_labels):
+        self.stage = stage
+        self.labels = span_labels
+
+    def __enter__(self):
+        self.started_at = time.time()
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        seconds = time.perf_counter() - self.start
+        _registry.observe(self.stage, seconds, {"type": "span", "stage": self.stage, "started_at": round(self.started_at, 6),
+                                                "duration_seconds": round(seconds, 6), "error": exc_type is not None,
+                                                **self.labels})
+        return False
+
+
+class _NoopSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_NOOP_SPAN = _NoopSpan()
+
+
+def span(stage, **span_labels):
+    """
+    Times the enclosed block as one `stage` span, tagged with the thread's labels plus
+    `span_labels`. Returns a shared no-op context manager when telemetry is disabled.
+    """
+    if not _enabled:
+        return _NOOP_SPAN
+    return _Span(stage, {**current_labels(), **{k: v for k, v in span_labels.items() if v is not None}})
+
+def observe(stage, seconds, **span_labels):
+    """Records a span whose duration was measured by the caller."""
+    if not _enabled:
+        return
+    _registry.observe(stage, seconds, {"type": "span", "stage": stage, "started_at": round(time.time() - seconds, 6),
+                                       "duration_seconds": round(seconds, 6), "error": False,
+                                       **current_labels(), **span_labels})
+
+def increment(name, amount=1, **counter_labels):
+    """Adds `amount` to a counter, e.g. increment("failures", stage="vlm")."""
+    if not _enabled:
+        return
+    _registry.increment(name, amount, counter_labels)
+
+
+# --- Export ---
+
+def summary():
+    return _registry.summary()
+
+def flush(jsonl_path=None, prometheus_path=None):
+    """
+    Appends the spans recorded since the last flush plus a metrics snapshot to the JSON-lines
+    file, and rewrites the Prometheus text file (suitable for node_exporter's textfile collector).
+    """
+    if not _enabled:
+        return
+    jsonl_path = jsonl_path or TELEMETRY_SETTINGS['jsonl_path']
+    prometheus_path = prometheus_path or TELEMETRY_SETTINGS['prometheus_path']
+    try:
+        records = _registry.drain()
+        records.append({"type": "metrics", "at": round(time.time(), 6), "stages": _registry.summary(),
+                        "counters": _registry.counter_values()})
+        with open(jsonl_path, 'a', encoding='utf-8') as f:
+            f.writelines(json.dumps(record) + "\n" for record in records)
+        tmp_path = f"{prometheus_path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(_registry.prometheus_text())
+        os.replace(tmp_path, prometheus_path)
+    except OSError as e:
+        logging.error("Failed to export telemetry: %s", e)
@@ -1,28 +1,179 @@
 # /stock_bot/trade_executor.py
 import logging
+import itertools
+import queue
+import threading
 import time
+from concurrent.futures import Future
+from config import EXECUTION_SETTINGS
+import telemetry
+
+
+class SimulatedBroker:
+    """
+    Local stand-in broker. Fills every order at its entry price after one simulated
+    round trip per batch.
+
+    Broker adapters implement place_orders(orders) -> list of confirmation dicts, one per
+    order and in the same order, each with at least a "status" key. Adapters that know the
+    account's holdings may also implement open_positions() -> list of trade-parameter dicts
+    ('symbol', 'entry_price', 'position_size_shares', 'risk_per_trade_usd'), which the
+    portfolio caps count first. The simulated broker tracks no exits, so it does not.
+    """
+    name = "SimulatedBroker"
+
+    def __init__(self, latency_seconds=1.0):
+        self.latency_seconds = latency_seconds
+        self._order_ids = itertools.count(1)
+
+    def place_orders(self, orders):
+        time.sleep(self.latency_seconds)
+        return [{"status": "FILLED", "order_id": next(self._order_ids),
+                 "fill_price": order['entry_price'], "timestamp": time.time()} for order in orders]
+
 
 class TradeExecutor:
-    # ... (init is the same) ...
-    def __init__(self, broker_name="SimulatedBroker"):
-        self.broker_name = broker_name
-        logging.info(f"TradeExecutor initialized for {self.broker_name}.")
+    """
+    Non-blocking order execution.
+
+    execute_trade() only queues the order and returns a Future. A single worker thread
+    drains the queue, sends the orders to the broker adapter in batches of up to
+    `batch_size` (collecting for up to `batch_window_seconds`), and resolves each Future
+    with the broker's confirmation plus the order's queue-to-confirmation latency.
+    """
+    def __init__(self, broker_name="SimulatedBroker", broker=None, settings=None):
+        self.settings = settings or EXECUTION_SETTINGS
+        self.broker = broker or SimulatedBroker(self.settings['simulated_latency_seconds'])
+        self.broker_name = getattr(self.broker, "name", broker_name)
+        self._queue = queue.Queue()
+        self._stats = {"orders": 0, "rejected": 0, "latency_sum": 0.0, "latency_max": 0.0}
+        self._stats_lock = threading.Lock()
+        self._worker = threading.Thread(target=self._run, name="order-executor", daemon=True)
+        self._worker.start()
+        logging.info("TradeExecutor initialized for %s.", self.broker_name)
+
+    def execute_trade(self, trade_parameters, callback=None):
+        """
+        Queues an order for execution without waiting for the broker.
 
-    def execute_trade(self, trade_parameters):
+        Args:
+            callback: Optional callable invoked with the confirmation dict once the order is done.
+
+        Returns:
+            Future: Resolves to the confirmation dict ("status" is "FILLED" or "REJECTED"),
+                or None if there was nothing to execute. Orders the broker returns no confirmation
+                for are REJECTED; a confirmation that cannot be processed fails the Future.
+        """
         if not trade_parameters:
             logging.warning("execute_trade called with no parameters. No action taken.")
-            return
+            return None
 
         logging.info("="*50)
-        logging.info(f"--- SIMULATING TRADE EXECUTION for {trade_parameters.get('symbol', 'N/A')} ---")
-        logging.info(f"   Signal:          {trade_parameters['signal']}")
-        logging.info(f"   Position Size:   {trade_parameters['position_size_shares']} shares") # Updated field name
-        logging.info(f"   Entry Price:     ~{trade_parameters['entry_price']}")
-        logging.info(f"   Stop Loss:       {trade_parameters['stop_loss']}")
-        logging.info(f"   Take Profit:     {trade_parameters['take_profit']}")
-        logging.info(f"   Risking:         ${trade_parameters['risk_per_trade_usd']}")
+        logging.info("--- QUEUEING TRADE EXECUTION for %s ---", trade_parameters.get('symbol', 'N/A'))
+        logging.info("   Signal:          %s", trade_parameters['signal'])
+        logging.info("   Position Size:   %s shares", trade_parameters['position_size_shares']) # Updated field name
+        logging.info("   Entry Price:     ~%s", trade_parameters['entry_price'])
+        logging.info("   Stop Loss:       %s", trade_parameters['stop_loss'])
+        logging.info("   Take Profit:     %s", trade_parameters['take_profit'])
+        logging.info("   Risking:         $%s", trade_parameters['risk_per_trade_usd'])
         logging.info("="*50)
-        
-        time.sleep(1) 
-        confirmation = {"status": "FILLED", "fill_price": trade_parameters['entry_price'], "timestamp": time.time()}
-        logging.info(f"TRADE CONFIRMED: {confirmation}")
\ No newline at end of file
+
+        future = Future()
+        if callback is not None:
+            future.add_done_callback(lambda done: callback(done.result()))
+        # The caller's labels (symbol, cycle_id) follow the order to the worker thread.
+        self._queue.put((trade_parameters, future, time.perf_counter(), telemetry.current_labels()))
+        return future
+
+    def _next_batch(self):
+        """Blocks for the first order, then collects more until the batch is full or the window closes."""
+        first = self._queue.get()
+        if first is None:
+            return None
+        batch = [first]
+        deadline = time.monotonic() + self.settings['batch_window_seconds']
+        while len(batch) < self.settings['batch_size']:
+            remaining = deadline - time.monotonic()
+            try:
+                item = self._queue.get(timeout=max(remaining, 0)) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is None:
+                # Put the stop marker back so the worker exits after this batch.
+                self._queue.put(None)
+                break
+            batch.append(item)
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            if batch is None:
+                return
+            orders = [order for order, _, _, _ in batch]
+            try:
+                confirmations = self.broker.place_orders(orders)
+            except Exception as e:
+                logging.error("%s failed to place %s orders: %s", self.broker_name, len(orders), e, exc_info=True)
+                confirmations = [{"status": "REJECTED", "reason": str(e), "timestamp": time.time()}] * len(orders)
+            confirmations = list(confirmations or [])
+            if len(confirmations) < len(orders):
+                logging.error("%s confirmed %s of %s orders; rejecting the rest.",
+                              self.broker_name, len(confirmations), len(orders))
+                confirmations += [{"status": "REJECTED", "reason": "no confirmation from broker",
+                                   "timestamp": time.time()}] * (len(orders) - len(confirmations))
+            for (order, future, queued_at, context), confirmation in zip(batch, confirmations):
+                with telemetry.labels(**context):
+                    try:
+                        self._complete(order, future, queued_at, dict(confirmation))
+                    except Exception as e:
+                        # One bad confirmation must neither kill the worker nor leave its Future pending.
+                        logging.error("Could not complete order for %s: %s", order.get('symbol', 'N/A'), e, exc_info=True)
+                        telemetry.increment("failures", stage="execute")
+                        if not future.done():
+                            future.set_exception(e)
+
+    def _complete(self, order, future, queued_at, confirmation):
+        latency = time.perf_counter() - queued_at
+        confirmation['latency_seconds'] = round(latency, 4)
+        if "status" not in confirmation:
+            confirmation.update(status="REJECTED", reason="confirmation without a status")
+        rejected = confirmation['status'] != "FILLED"
+        with self._stats_lock:
+            self._stats["orders"] += 1
+            self._stats["rejected"] += rejected
+            self._stats["latency_sum"] += latency
+            self._stats["latency_max"] = max(self._stats["latency_max"], latency)
+        telemetry.observe("execute", latency, symbol=order.get('symbol'))
+        if rejected:
+            telemetry.increment("failures", stage="execute")
+            logging.error("TRADE REJECTED for %s: %s", order.get('symbol', 'N/A'), confirmation)
+        else:
+            telemetry.increment("trades_executed", signal=order['signal'])
+            logging.info("TRADE CONFIRMED for %s: %s", order.get('symbol', 'N/A'), confirmation)
+        # Exceptions raised by callbacks are logged by concurrent.futures and never reach the worker.
+        future.set_result(confirmation)
+
+    def open_positions(self):
+        """The positions the broker adapter reports as held, or [] if it does not track them."""
+        report = getattr(self.broker, "open_positions", None)
+        if report is None:
+            return []
+        try:
+            return list(report())
+        except Exception as e:
+            logging.error("Could not read open positions from %s: %s", self.broker_name, e)
+            return []
+
+    def stats(self):
+        """Order counts and queue-to-confirmation latency so far."""
+        with self._stats_lock:
+            orders = self._stats["orders"]
+            return {"orders": orders, "rejected": self._stats["rejected"],
+                    "mean_latency_seconds": round(self._stats["latency_sum"] / orders, 4) if orders else None,
+                    "max_latency_seconds": round(self._stats["latency_max"], 4)}
+
+    def close(self):
+        """Waits for every queued order to be confirmed, then stops the worker."""
+        self._queue.put(None)
+        self._worker.join()
@@ -1,14 +1,99 @@
 # /xauusd_bot/utils.py
 
+import atexit
+import json
 import logging
+import logging.handlers
+import queue
+from datetime import datetime, timezone
+from config import LOGGING_SETTINGS
+import telemetry
+
+TEXT_FORMAT = '%(asctime)s - %(levelname)s - %(module)s - %(message)s'
+
+# The background listener started by setup_logging in queue mode, if any.
+_listener = None
+
+
+class ContextFilter(logging.Filter):
+    """Copies the calling thread's telemetry labels (symbol, timeframe, cycle_id) onto each record."""
+    def filter(self, record):
+        record.context = telemetry.current_labels()
+        return True
+
+
+class DeferredQueueHandler(logging.handlers.QueueHandler):
+    """
+    Enqueues records as they are. The message is formatted by the listener thread, so the
+    calling thread only pays for creating the record and putting it on the queue.
+    """
+    def prepare(self, record):
+        return record
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line: time, level, module, thread, message, context labels and exception."""
+    def format(self, record):
+        entry = {
+            "time": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            "level": record.levelname,
+            "module": record.module,
+            "thread": record.threadName,
+            "message": record.getMessage(),
+            **getattr(record, "context", {}),
+        }
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class ContextTextFormatter(logging.Formatter):
+    """The classic text format, with the record's context labels appended in brackets."""
+    def format(self, record):
+        text = super().format(record)
+        context = getattr(record, "context", None)
+        if context:
+            text += " [" + " ".join(f"{key}={value}" for key, value in context.items()) + "]"
+        return text
+
 
 def setup_logging():
-    """Configures the root logger for the application."""
-    logging.basicConfig(
-        level=logging.INFO,
-        format='%(asctime)s - %(levelname)s - %(module)s - %(message)s',
-        handlers=[
-            logging.FileHandler("trading_bot.log"),
-            logging.StreamHandler()
-        ]
-    )
\ No newline at end of file
+    """
+    Configures the root logger for the application.
+
+    With LOGGING_SETTINGS['queue'] on, log calls only enqueue their records; a background
+    listener formats them and writes to a size-rotated file (JSON lines if 'json' is on)
+    and to the console. Otherwise records are written synchronously, as plain text.
+    """
+    global _listener
+    if _listener is not None:
+        return
+    level = getattr(logging, LOGGING_SETTINGS['level'])
+    file_handler = logging.handlers.RotatingFileHandler(LOGGING_SETTINGS['path'],
+                                                        maxBytes=LOGGING_SETTINGS['max_bytes'],
+                                                        backupCount=LOGGING_SETTINGS['backup_count'],
+                                                        encoding='utf-8')
+    console_handler = logging.StreamHandler()
+    if not LOGGING_SETTINGS['queue']:
+        for handler in (file_handler, console_handler):
+            handler.setFormatter(logging.Formatter(TEXT_FORMAT))
+        logging.basicConfig(level=level, handlers=[file_handler, console_handler])
+        return
+
+    file_handler.setFormatter(JsonFormatter() if LOGGING_SETTINGS['json'] else ContextTextFormatter(TEXT_FORMAT))
+    console_handler.setFormatter(ContextTextFormatter(TEXT_FORMAT))
+    log_queue = queue.SimpleQueue()
+    queue_handler = DeferredQueueHandler(log_queue)
+    queue_handler.addFilter(ContextFilter())
+    logging.basicConfig(level=level, handlers=[queue_handler])
+    _listener = logging.handlers.QueueListener(log_queue, file_handler, console_handler)
+    _listener.start()
+    atexit.register(shutdown_logging)
+
+
+def shutdown_logging():
+    """Writes out every queued record and stops the background listener."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
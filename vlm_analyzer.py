@@ -4,80 +4,207 @@ import base64
 import requests
 import logging
 import json
-from config import OPENAI_API_KEY, VLM_PROMPT
+from config import (OPENAI_API_KEY, VLM_PROMPT, VLM_BATCH_INSTRUCTIONS, VLM_MODEL, ANALYSIS_CACHE_SETTINGS,
+                    VLM_CLIENT_SETTINGS, VLM_BATCH_SETTINGS, IMAGE_ENCODING_SETTINGS)
+from analysis_cache import AnalysisCache, chart_cache_key
+from image_encoder import encode_for_upload, log_encoding, cache_fingerprint
+from vlm_client import VLMClient
+import telemetry
 
 class VLMTechnicalAnalyzer:
     """
     Uses OpenAI's Vision Language Model to analyze chart images.
     """
-    def __init__(self):
+    def __init__(self, client=None, image_settings=None):
         if not OPENAI_API_KEY or OPENAI_API_KEY == "sk-YOUR_OPENAI_API_KEY_HERE":
             raise ValueError("OpenAI API key is not configured in config.py")
         self.api_key = OPENAI_API_KEY
-        self.headers = {
-            "Content-Type": "application/json",
-            "Authorization": f"Bearer {self.api_key}"
-        }
+        self.client = client or VLMClient(self.api_key, VLM_CLIENT_SETTINGS)
+        self.model = VLM_MODEL
+        self.image_settings = image_settings or IMAGE_ENCODING_SETTINGS
+        self.cache = None
+        if ANALYSIS_CACHE_SETTINGS['enabled']:
+            self.cache = AnalysisCache(ANALYSIS_CACHE_SETTINGS['directory'],
+                                       ANALYSIS_CACHE_SETTINGS['ttl_seconds'],
+                                       ANALYSIS_CACHE_SETTINGS['max_entries'])
+
+    def close(self):
+        """Closes the pooled HTTP connections."""
+        self.client.close()
+
+    def cache_key(self, df, indicator_settings, title):
+        """Returns the analysis cache key for a chart of `df`, or None if caching is disabled."""
+        if self.cache is None:
+            return None
+        return chart_cache_key(df, indicator_settings, title, VLM_PROMPT, self.model,
+                               image_settings=cache_fingerprint(self.image_settings))
+
+    def get_cached_analysis(self, cache_key):
+        """Returns the cached analysis for `cache_key`, or None on a miss or if caching is disabled."""
+        if not cache_key or self.cache is None:
+            return None
+        analysis = self.cache.get(cache_key)
+        if analysis is not None:
+            logging.info("VLM analysis served from cache.")
+        return analysis
+
+    @staticmethod
+    def _describe(image):
+        return f"in-memory chart ({len(image)} bytes)" if isinstance(image, bytes) else image
 
-    def _encode_image(self, image_path):
-        """Encodes an image file to a base64 string."""
+    def _encode_image(self, image):
+        """
+        Encodes an image file, or PNG bytes rendered in memory, to a base64 string.
+
+        In-memory charts arrive already compacted by the renderer (see IMAGE_ENCODING_SETTINGS);
+        chart files saved to disk are compacted here when encoding is enabled.
+        """
         try:
-            with open(image_path, "rb") as image_file:
-                return base64.b64encode(image_file.read()).decode('utf-8')
+            if isinstance(image, bytes):
+                return base64.b64encode(image).decode('utf-8')
+            with open(image, "rb") as image_file:
+                image_bytes = image_file.read()
         except Exception as e:
-            logging.error(f"Error encoding image {image_path}: {e}")
+            logging.error("Error encoding image %s: %s", self._describe(image), e)
             return None
+        image_bytes, stats, error = encode_for_upload(image_bytes, self.image_settings)
+        log_encoding(image, stats, error)
+        return base64.b64encode(image_bytes).decode('utf-8')
+
+    def _image_part(self, base64_image):
+        """The image_url content part of a request, with the configured detail level when encoding is on."""
+        image_url = {"url": f"data:image/png;base64,{base64_image}"}
+        if self.image_settings['enabled']:
+            image_url["detail"] = self.image_settings['detail']
+        return {"type": "image_url", "image_url": image_url}
 
-    def analyze_chart(self, image_path):
+    @staticmethod
+    def _parse_response(response_text):
+        # Clean the response to ensure it's valid JSON
+        # VLM can sometimes wrap the JSON in ```json ... ```
+        if response_text.strip().startswith("```json"):
+            response_text = response_text.strip()[7:-3]
+        return json.loads(response_text)
+
+    def analyze_chart(self, image, cache_key=None):
         """
         Sends a chart image to the OpenAI VLM and returns the structured analysis.
+
+        Args:
+            image (str | bytes): Path to a chart image file, or PNG bytes from render_chart(as_bytes=True).
+            cache_key (str): Optional key from cache_key(). The fresh analysis is stored under
+                it; check get_cached_analysis() first to avoid the API call altogether.
         
         Returns:
             dict: The JSON analysis from the VLM, or None if an error occurred.
         """
-        logging.info(f"Starting VLM analysis for chart: {image_path}")
-        base64_image = self._encode_image(image_path)
+        logging.info("Starting VLM analysis for chart: %s", self._describe(image))
+        base64_image = self._encode_image(image)
         if not base64_image:
             return None
 
         payload = {
-            "model": "gpt-4o-mini",
+            "model": self.model,
             "messages": [
                 {
                     "role": "user",
                     "content": [
                         {"type": "text", "text": VLM_PROMPT},
-                        {
-                            "type": "image_url",
-                            "image_url": {
-                                "url": f"data:image/png;base64,{base64_image}"
-                            }
-                        }
+                        self._image_part(base64_image)
                     ]
                 }
             ],
-            "max_tokens": 1500
+            "max_tokens": VLM_BATCH_SETTINGS['max_tokens_per_chart']
         }
 
+        response_text = None
         try:
-            response = requests.post("https://api.openai.com/v1/chat/completions", headers=self.headers, json=payload)
-            response.raise_for_status()  # Raises an exception for 4XX/5XX errors
-            
-            response_text = response.json()['choices'][0]['message']['content']
-            
-            # Clean the response to ensure it's valid JSON
-            # VLM can sometimes wrap the JSON in ```json ... ```
-            if response_text.strip().startswith("```json"):
-                response_text = response_text.strip()[7:-3]
-
-            analysis_json = json.loads(response_text)
+            with telemetry.span("vlm"):
+                response_text = self.client.post_chat(payload)['choices'][0]['message']['content']
+            analysis_json = self._parse_response(response_text)
             logging.info("VLM analysis received and parsed successfully.")
+            if cache_key and self.cache is not None:
+                self.cache.put(cache_key, analysis_json)
             return analysis_json
 
         except requests.exceptions.RequestException as e:
-            logging.error(f"API request failed: {e}")
+            logging.error("API request failed: %s", e)
+            telemetry.increment("failures", stage="vlm")
+            return None
+        except (json.JSONDecodeError, KeyError, IndexError, AttributeError, TypeError) as e:
+            logging.error("Failed to parse VLM response as JSON: %s", e)
+            logging.error("Raw response received: %s", response_text)
+            telemetry.increment("failures", stage="vlm")
             return None
-        except (json.JSONDecodeError, KeyError) as e:
-            logging.error(f"Failed to parse VLM response as JSON: {e}")
-            logging.error(f"Raw response received: {response_text}")
-            return None
\ No newline at end of file
+
+    def analyze_charts(self, charts, symbol_labels=None):
+        """
+        Analyses several charts in one request whose answer is keyed by symbol and timeframe.
+
+        Args:
+            charts (list): (symbol, timeframe, image, cache_key) tuples; see analyze_chart
+                for image and cache_key.
+            symbol_labels (dict): Optional {symbol: telemetry labels} for the single-chart
+                fallbacks, e.g. the symbol's cycle_id.
+
+        Returns:
+            dict: Maps (symbol, timeframe) to the analysis of that chart, or None if it failed.
+                Charts missing from the batched answer, or all of them if the answer cannot
+                be parsed, are re-analysed with analyze_chart.
+        """
+        if len(charts) == 1:
+            symbol, timeframe, image, cache_key = charts[0]
+            return {(symbol, timeframe): self.analyze_chart(image, cache_key=cache_key)}
+
+        logging.info("Starting batched VLM analysis of %s charts: %s", len(charts),
+                     ", ".join(f"{symbol} {timeframe}" for symbol, timeframe, _, _ in charts))
+        content = [{"type": "text", "text": VLM_PROMPT + VLM_BATCH_INSTRUCTIONS}]
+        for symbol, timeframe, image, _ in charts:
+            base64_image = self._encode_image(image)
+            if not base64_image:
+                return {(symbol, timeframe): None for symbol, timeframe, _, _ in charts}
+            content.append({"type": "text", "text": f"{symbol} {timeframe}"})
+            content.append(self._image_part(base64_image))
+        payload = {
+            "model": self.model,
+            "messages": [{"role": "user", "content": content}],
+            "max_tokens": VLM_BATCH_SETTINGS['max_tokens_per_chart'] * len(charts)
+        }
+
+        response_text = None
+        try:
+            with telemetry.span("vlm", charts=len(charts)):
+                response_text = self.client.post_chat(payload)['choices'][0]['message']['content']
+            batch_json = self._parse_response(response_text)
+            if not isinstance(batch_json, dict):
+                raise TypeError(f"expected a JSON object keyed by symbol, got {type(batch_json).__name__}")
+        except requests.exceptions.RequestException as e:
+            # The client has already retried; per-chart requests would most likely fail the same way.
+            logging.error("Batched API request failed: %s", e)
+            telemetry.increment("failures", stage="vlm")
+            return {(symbol, timeframe): None for symbol, timeframe, _, _ in charts}
+        except (json.JSONDecodeError, KeyError, IndexError, AttributeError, TypeError) as e:
+            logging.error("Failed to parse batched VLM response: %s", e)
+            logging.error("Raw response received: %s", response_text)
+            batch_json = {}
+
+        analyses, missing = {}, []
+        for symbol, timeframe, image, cache_key in charts:
+            entry = batch_json.get(symbol)
+            analysis = entry.get(timeframe) if isinstance(entry, dict) else None
+            if isinstance(analysis, dict) and 'technical_sentiment' in analysis:
+                analyses[(symbol, timeframe)] = analysis
+                if cache_key and self.cache is not None:
+                    self.cache.put(cache_key, analysis)
+            else:
+                missing.append((symbol, timeframe, image, cache_key))
+        logging.info("Batched VLM analysis returned %s of %s charts.", len(analyses), len(charts))
+
+        if missing:
+            logging.warning("Falling back to single-chart requests for %s charts.", len(missing))
+            telemetry.increment("vlm_batch_fallbacks", len(missing))
+            for symbol, timeframe, image, cache_key in missing:
+                fallback_labels = {**(symbol_labels or {}).get(symbol, {}), "symbol": symbol, "timeframe": timeframe}
+                with telemetry.labels(**fallback_labels):
+                    analyses[(symbol, timeframe)] = self.analyze_chart(image, cache_key=cache_key)
+        return analyses
@@ -0,0 +1,153 @@
+# /stock_bot/vlm_client.py
+
+import base64
+import binascii
+import logging
+import json
+import random
+import struct
+import threading
+import time
+import requests
+from requests.adapters import HTTPAdapter
+from image_encoder import LOW_DETAIL_TOKENS, estimate_image_tokens
+import telemetry
+
+# Status codes worth retrying: rate limiting and transient server errors.
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+
+
+def _image_tokens(image_url):
+    """
+    Estimated tokens of an image_url content part. The size of a PNG data URL is read from its
+    header; other images are budgeted as the largest high-detail image.
+    """
+    if image_url.get("detail") == "low":
+        return LOW_DETAIL_TOKENS
+    url = image_url.get("url", "")
+    try:
+        # The first 32 base64 characters decode to the PNG signature and the IHDR width/height.
+        header = base64.b64decode(url.partition(",")[2][:32])
+        if header[:8] == PNG_SIGNATURE:
+            return estimate_image_tokens(*struct.unpack(">II", header[16:24]))
+    except (binascii.Error, struct.error, ZeroDivisionError):
+        pass
+    return estimate_image_tokens(2048, 2048)
+
+
+def estimate_request_tokens(payload):
+    """Estimates the tokens a chat-completions request counts against the per-minute limit."""
+    tokens = payload.get("max_tokens", 0)
+    for message in payload.get("messages", []):
+        content = message.get("content", "")
+        parts = content if isinstance(content, list) else [{"type": "text", "text": content}]
+        for part in parts:
+            if part.get("type") == "text":
+                tokens += len(part["text"]) // 4
+            elif part.get("type") == "image_url":
+                tokens += _image_tokens(part.get("image_url", {}))
+    return tokens
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket refilled continuously at `rate_per_minute`.
+    acquire() blocks until the requested amount is available.
+    """
+    def __init__(self, rate_per_minute, capacity=None):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = capacity or rate_per_minute
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, amount=1):
+        # Requests larger than the bucket could never be served; cap them at capacity.
+        amount = min(amount, self.capacity)
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= amount:
+                    self.tokens -= amount
+                    return
+                wait = (amount - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+class VLMClient:
+    """
+    HTTP client for the chat-completions API with keep-alive connection pooling,
+    timeouts, jittered exponential backoff on 429/5xx and request/token rate limits.
+    post_chat() blocks; callers run it from their own worker threads.
+    """
+    def __init__(self, api_key, settings):
+        self.base_url = settings['base_url'].rstrip('/')
+        self.timeout = (settings['connect_timeout'], settings['read_timeout'])
+        self.max_retries = settings['max_retries']
+        self.backoff_base = settings['backoff_base_seconds']
+        self.backoff_max = settings['backoff_max_seconds']
+        self.request_bucket = TokenBucket(settings['requests_per_minute'])
+        self.token_bucket = TokenBucket(settings['tokens_per_minute'])
+
+        self.session = requests.Session()
+        self.session.headers.update({
+            "Content-Type": "application/json",
+            "Authorization": f"Bearer {api_key}"
+        })
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=settings['pool_size'])
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    def _backoff(self, attempt, response=None):
+        """Seconds to wait before the next attempt, honouring Retry-After when the server sends it."""
+        if response is not None:
+            retry_after = response.headers.get("Retry-After")
+            if retry_after:
+                try:
+                    return min(float(retry_after), self.backoff_max)
+                except ValueError:
+                    pass
+        # Full jitter keeps concurrent retries from arriving in lock-step.
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+
+    def post_chat(self, payload):
+        """
+        Sends a chat-completions request and returns the decoded JSON response.
+
+        Raises:
+            requests.exceptions.RequestException: If the request still fails after all retries.
+        """
+        url = f"{self.base_url}/chat/completions"
+        tokens = estimate_request_tokens(payload)
+        # Serialised once so the uploaded bytes can be counted; the session sends JSON headers.
+        body = json.dumps(payload).encode('utf-8')
+        attempt = 0
+        while True:
+            # Retries count against the same per-minute budgets as first attempts.
+            self.request_bucket.acquire()
+            self.token_bucket.acquire(tokens)
+            telemetry.increment("vlm_bytes_uploaded", len(body))
+            try:
+                response = self.session.post(url, data=body, timeout=self.timeout)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                telemetry.increment("vlm_api_calls", status="error")
+                if attempt >= self.max_retries:
+                    raise
+                delay = self._backoff(attempt)
+                logging.warning("VLM request failed (%s). Retrying in %.1fs (%s/%s)...", e, delay, attempt + 1, self.max_retries)
+            else:
+                telemetry.increment("vlm_api_calls", status=str(response.status_code))
+                if response.status_code not in RETRYABLE_STATUS or attempt >= self.max_retries:
+                    response.raise_for_status()  # Raises an exception for 4XX/5XX errors
+                    return response.json()
+                delay = self._backoff(attempt, response)
+                logging.warning("VLM API returned %s. Retrying in %.1fs (%s/%s)...", response.status_code, delay, attempt + 1, self.max_retries)
+            attempt += 1
+            time.sleep(delay)
+
+    def close(self):
+        self.session.close()